@@ -0,0 +1,435 @@
+# -*- coding:utf-8 -*-
+'''性能测试脚本
+
+    python benchmark.py judge_win
+    python benchmark.py --model 3 batch     # 用模型3的网络, 否则用均匀先验的替身
+'''
+from __future__ import division
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import argparse
+import asyncio
+import gc
+from time import time
+
+import numpy as np
+import utils
+from board import Board
+from mcts import MCT, RootParallelMCT, AsyncMCT
+from evaluator import AsyncEvaluator
+from pattern import PatternTable
+from renju import ForbiddenDetector
+
+WIN_PATTERN = np.ones(utils.WIN_NUM, np.int64)
+MODEL_NUM = None
+
+
+def correlate_judge_win(board, index):
+    '''原先基于`np.correlate`的胜负判断, 作为对照'''
+    color = board.board[index]
+    target = utils.WIN_NUM * color
+    x, y = index % board.size, index // board.size
+    lines = [board.row(y), board.col(x), board.diag(x, y), board.back_diag(x, y)]
+    for line in lines:
+        if line.size >= utils.WIN_NUM and target in np.correlate(line, WIN_PATTERN):
+            return True
+    return False
+
+
+class UniformNet(object):
+    '''均匀先验, 零估值的网络替身, 只测量搜索本身的开销'''
+    def __init__(self, size=utils.SIZE):
+        self.predict = np.ones(size ** 2, np.float32) / size ** 2
+
+    def get_predict_and_value(self, feature):
+        return self.predict.copy(), 0.0
+
+    def get_predicts_and_values(self, features):
+        return np.tile(self.predict, (len(features), 1)), np.zeros(len(features), np.float32)
+
+
+class FocusedNet(UniformNet):
+    '''先验集中在中心附近`focus`格内的网络替身, 搜索反复走这几格, 不同次序常到达同一局面'''
+    def __init__(self, size=utils.SIZE, focus=3, rate=1e-3):
+        super(FocusedNet, self).__init__(size)
+        y, x = np.divmod(np.arange(size ** 2), size)
+        center = (size - focus) // 2
+        near = (x >= center) & (x < center + focus) & (y >= center) & (y < center + focus)
+        self.predict = np.where(near, 1.0, rate).astype(np.float32)
+        self.predict /= self.predict.sum()
+
+
+class CountingNet(object):
+    '''记录评估局面数的网络包装'''
+    def __init__(self, net):
+        self.net = net
+        self.count = 0
+
+    def get_predict_and_value(self, feature):
+        self.count += 1
+        return self.net.get_predict_and_value(feature)
+
+    def get_predicts_and_values(self, features):
+        self.count += len(features)
+        return self.net.get_predicts_and_values(features)
+
+
+def make_net():
+    '''`--model`给出时加载真实网络, 否则用`UniformNet`'''
+    if MODEL_NUM is None:
+        return UniformNet()
+    from net import Net
+    return Net(MODEL_NUM)
+
+
+def random_board(move_num, size=utils.SIZE, seed=None):
+    '''随机落子`move_num`步, 返回棋盘'''
+    rng = np.random.RandomState(seed)
+    board = Board(size)
+    for index in rng.permutation(board.full_size)[:move_num]:
+        board.move(index)
+        board.round_change(1)
+    return board
+
+
+def clustered_board(move_num, size=utils.SIZE, seed=None):
+    '''从中心开始, 每步随机落在已有棋子相邻的空位, 返回成块的棋盘, 比`random_board`更像实战'''
+    rng = np.random.RandomState(seed)
+    board = Board(size)
+    board.set_near_radius(1)
+    board.move(board.full_size // 2 + size // 2)
+    board.round_change(1)
+    for _ in range(move_num - 1):
+        board.move(rng.choice(np.flatnonzero(board.near_mask)))
+        board.round_change(1)
+    board.set_near_radius(utils.NEAR_RADIUS)
+    return board
+
+
+def rate(func, args_list, repeat=1):
+    '''返回`func`每秒调用次数'''
+    start_time = time()
+    for _ in range(repeat):
+        for args in args_list:
+            func(*args)
+    return repeat * len(args_list) / (time() - start_time)
+
+
+def bench_judge_win(board_num=50, move_num=60, repeat=20):
+    '''比较位棋盘与`np.correlate`判断胜负的速度'''
+    cases = []
+    for seed in range(board_num):
+        board = random_board(move_num, seed=seed)
+        for index in board.move_history[-10:]:
+            assert board.judge_win(index) == correlate_judge_win(board, index)
+            cases.append((board, index))
+
+    bitboard_rate = rate(lambda board, index: board.judge_win(index), cases, repeat)
+    correlate_rate = rate(correlate_judge_win, cases, repeat)
+    print('judge_win on {0}x{0}, {1} checks'.format(utils.SIZE, len(cases) * repeat))
+    print('  bitboard : {:>12.0f} checks/sec'.format(bitboard_rate))
+    print('  correlate: {:>12.0f} checks/sec'.format(correlate_rate))
+    print('  speed up : {:>12.1f}x'.format(bitboard_rate / correlate_rate))
+
+
+def bench_playout(move_nums=(10, 100, 300), playout_num=400):
+    '''比较 落子/撤销 与 deepcopy 两种搜索方式在不同手数时的playouts/sec, 后者每个playout复制棋盘状态(查表共享)'''
+    net = UniformNet()
+    print('MCT.play on {0}x{0}, {1} playouts'.format(utils.SIZE, playout_num))
+    for move_num in move_nums:
+        rates = []
+        for search_undo in (True, False):
+            board = random_board(move_num, seed=move_num)
+            tree = MCT(board, net=net)
+            tree.max_evaluate_time = playout_num
+            tree.search_undo = search_undo
+            rates.append(rate(tree.play, [()]) * playout_num)
+        print('  move {:>3}: undo {:>8.0f}, deepcopy {:>8.0f} playouts/sec'.format(move_num, *rates))
+
+
+def bench_tree(move_num=10, playout_num=2000):
+    '''比较`MCTNode`对象树与数组树的playouts/sec'''
+    net = UniformNet()
+    print('MCT tree backends on {0}x{0}, move {1}, {2} playouts'.format(utils.SIZE, move_num, playout_num))
+    for tree_type in ('node', 'array'):
+        tree = MCT(random_board(move_num, seed=move_num), net=net, tree_type=tree_type)
+        tree.max_evaluate_time = playout_num
+        print('  {:>5}: {:>8.0f} playouts/sec'.format(tree_type, rate(tree.play, [()]) * playout_num))
+
+
+def bench_batch(batch_sizes=(1, 2, 4, 8, 16, 32), move_num=30, playout_num=512):
+    '''批量叶节点评估在不同批大小`K`下的evaluations/sec'''
+    net = make_net()
+    print('MCT batched evaluation on {0}x{0}, move {1}, {2} playouts'.format(utils.SIZE, move_num, playout_num))
+    for batch_size in batch_sizes:
+        counting_net = CountingNet(net)
+        tree = MCT(random_board(move_num, seed=move_num), net=counting_net)
+        tree.max_evaluate_time = playout_num
+        tree.batch_size = batch_size
+        start_time = time()
+        tree.play()
+        print('  K = {:>2}: {:>8.0f} evals/sec'.format(batch_size, counting_net.count / (time() - start_time)))
+
+
+def bench_threads(thread_nums=(1, 2, 4, 8, 16), move_num=30, playout_num=512):
+    '''多线程共享搜索树时在不同线程数下的playouts/sec'''
+    net = make_net()
+    print('MCT tree-parallel search on {0}x{0}, move {1}, {2} playouts'.format(utils.SIZE, move_num, playout_num))
+    for thread_num in thread_nums:
+        counting_net = CountingNet(net)
+        tree = MCT(random_board(move_num, seed=move_num), net=counting_net, thread_num=thread_num)
+        tree.max_evaluate_time = playout_num
+        start_time = time()
+        tree.play()
+        cost = time() - start_time
+        print('  {:>2} threads: {:>8.0f} playouts/sec, {:>8.0f} evals/sec'.format(
+            thread_num, playout_num / cost, counting_net.count / cost))
+
+
+def bench_processes(process_nums=(1, 2, 4, 8), move_num=30, playout_num=512):
+    '''根并行搜索在不同进程数下的playouts/sec, 总playout数不变'''
+    net = make_net() if MODEL_NUM is None else None
+    print('MCT root-parallel search on {0}x{0}, move {1}, {2} playouts'.format(utils.SIZE, move_num, playout_num))
+    for process_num in process_nums:
+        tree = RootParallelMCT(random_board(move_num, seed=move_num), MODEL_NUM, net, process_num=process_num)
+        tree.max_evaluate_time = playout_num
+        start_time = time()
+        tree.play()
+        cost = time() - start_time
+        tree.close()
+        print('  {:>2} processes: {:>8.0f} playouts/sec'.format(process_num, playout_num / cost))
+
+
+def count_nodes(root):
+    '''搜索树中不同节点的个数, 共享的子树只计一次'''
+    seen, stack = set(), [root]
+    while stack:
+        node = stack.pop()
+        for child in node.children.values():
+            if id(child) not in seen:
+                seen.add(id(child))
+                stack.append(child)
+    return len(seen) + 1
+
+
+def bench_transposition(move_nums=(10, 30, 60), playout_num=800):
+    '''相同playout数下, 使用置换表前后分配的节点数与网络评估次数, 无模型时用`FocusedNet`'''
+    net = FocusedNet() if MODEL_NUM is None else make_net()
+    print('MCT transposition table on {0}x{0}, {1} playouts'.format(utils.SIZE, playout_num))
+    for move_num in move_nums:
+        for transposition in (False, True):
+            counting_net = CountingNet(net)
+            tree = MCT(random_board(move_num, seed=move_num), net=counting_net, transposition=transposition)
+            tree.max_evaluate_time = playout_num
+            start_time = time()
+            tree.play()
+            print('  move {:>3}, {:<13}: {:>8} nodes, {:>5} evals, {:>6.2f} sec'.format(
+                move_num, 'transposition' if transposition else 'tree', count_nodes(tree.root),
+                counting_net.count, time() - start_time))
+
+
+def bench_cache(move_num=10, playout_num=400):
+    '''连续走`move_num`步时评估缓存的命中率, 与实际调用网络的次数'''
+    counting_net = CountingNet(make_net())
+    board = Board()
+    tree = MCT(board, net=counting_net)
+    tree.max_evaluate_time = playout_num
+    print('MCT evaluation cache on {0}x{0}, {1} moves, {2} playouts'.format(utils.SIZE, move_num, playout_num))
+    for _ in range(move_num):
+        tree.play()
+        index = tree.get_move(tree.get_move_probability())
+        board.move(index)
+        board.round_change(1)
+        tree.update_one(index)
+    cache = tree.net
+    print('  hit {}, miss {}, hit rate {:.1%}, net evaluations {}'.format(
+        cache.hit, cache.miss, cache.hit_rate, counting_net.count))
+
+
+def bench_memory(move_num=5, playout_num=400, max_nodes=(None, 20000)):
+    '''连续走`move_num`步并复用子树时搜索树的最大节点数与内存, 有无节点上限'''
+    net = make_net()
+    print('MCT tree size on {0}x{0}, {1} moves, {2} playouts'.format(utils.SIZE, move_num, playout_num))
+    for tree_type in ('node', 'array'):
+        for limit in max_nodes:
+            board = Board()
+            tree = MCT(board, net=net, tree_type=tree_type)
+            tree.max_evaluate_time = playout_num
+            tree.max_nodes = limit
+            size, memory = 0, 0
+            for _ in range(move_num):
+                tree.play()
+                size, memory = max(size, tree.get_tree_size()), max(memory, tree.get_tree_memory())
+                index = tree.get_move(tree.get_move_probability())
+                board.move(index)
+                board.round_change(1)
+                tree.update_one(index)
+            print('  {:<5} tree, limit {:>6}: {:>8} nodes, {:>7.1f} MB'.format(
+                tree_type, str(limit), size, memory / 2 ** 20))
+
+
+def bench_lazy(move_nums=(10, 100), playout_num=800, widen_base=4):
+    '''一次建好全部子节点, 与首次选中时才建子节点(可加渐进加宽)的节点内存与每秒扩展数'''
+    net = make_net()
+    print('MCT lazy expansion on {0}x{0}, {1} playouts'.format(utils.SIZE, playout_num))
+    for move_num in move_nums:
+        for name, lazy, widen in (('eager', False, None), ('lazy', True, None), ('widen', True, widen_base)):
+            tree = MCT(random_board(move_num, seed=move_num), net=net, solver=False, lazy=lazy)
+            tree.tree.widen_base = widen
+            tree.max_evaluate_time = playout_num
+            tree.play()
+            stats = tree.stats
+            print('  move {:>3}, {:<5}: {:>4} bytes/node, {:>8} nodes, {:>7.2f} MB, {:>6.0f} expansions/sec'.format(
+                move_num, name, tree.tree.node_bytes, tree.get_tree_size(), tree.get_tree_memory() / 2 ** 20,
+                stats.evaluations / stats.total_time))
+
+
+def bench_near(move_nums=(10, 60), playout_num=400, radii=(1, 2, 3)):
+    '''只扩展棋子附近的格时, 每次扩展的子节点数与搜索树的节点数和内存'''
+    net = make_net()
+    print('MCT near stones candidates on {0}x{0}, {1} playouts'.format(utils.SIZE, playout_num))
+    for move_num in move_nums:
+        for radius in (None,) + tuple(radii):
+            board = clustered_board(move_num, seed=move_num)
+            if radius is not None:
+                board.set_near_radius(radius)
+            tree = MCT(board, net=net, solver=False, near_only=radius is not None)
+            tree.max_evaluate_time = playout_num
+            tree.play()
+            print('  move {:>3}, radius {:>4}: {:>6.1f} children/expansion, {:>8} nodes, {:>7.2f} MB'.format(
+                move_num, str(radius), tree.tree.allocated / max(tree.stats.evaluations, 1),
+                tree.get_tree_size(), tree.get_tree_memory() / 2 ** 20))
+
+
+def bench_collect(move_num=8, playout_num=400):
+    '''连续走`move_num`步的每步耗时, 每步后强制`gc.collect`与只靠引用计数释放旧子树'''
+    net = make_net()
+    print('MCT per move latency on {0}x{0}, {1} moves, {2} playouts'.format(utils.SIZE, move_num, playout_num))
+    for collect in (True, False):
+        np.random.seed(0)
+        board = Board()
+        tree = MCT(board, net=net, solver=False)
+        tree.max_evaluate_time = playout_num
+        total_time, collect_time = 0, 0
+        for _ in range(move_num):
+            start_time = time()
+            tree.play()
+            index = tree.get_move(tree.get_move_probability())
+            board.move(index)
+            board.round_change(1)
+            tree.update_one(index)
+            if collect:
+                collect_start = time()
+                gc.collect()
+                collect_time += time() - collect_start
+            total_time += time() - start_time
+        print('  {:<9}: {:>7.1f} ms/move, of which {:>6.1f} ms/move gc.collect'.format(
+            'collect' if collect else 'refcount', 1000 * total_time / move_num, 1000 * collect_time / move_num))
+
+
+def bench_async(search_nums=(1, 8, 32), playout_num=200, move_num=10):
+    '''同一事件循环中并发`search_num`个搜索, 共用一个`AsyncEvaluator`时网络的调用次数与平均批大小'''
+    net = make_net()
+    print('AsyncMCT on {0}x{0}, {1} playouts per search'.format(utils.SIZE, playout_num))
+    for search_num in search_nums:
+        counting_net = CountingNet(net)
+        evaluator = AsyncEvaluator(counting_net)
+        trees = [
+            AsyncMCT(random_board(move_num, seed=seed), evaluator, solver=False) for seed in range(search_num)
+            ]
+        for tree in trees:
+            tree.max_evaluate_time = playout_num
+        async def search_all():
+            await asyncio.gather(*(tree.play_async() for tree in trees))
+
+        start_time = time()
+        asyncio.run(search_all())
+        cost = time() - start_time
+        print('  {:>3} searches: {:>6} evals in {:>5} net calls, {:>5.1f} per batch, {:>7.0f} playouts/sec'.format(
+            search_num, counting_net.count, evaluator.batch_num, evaluator.mean_batch_size,
+            search_num * playout_num / cost))
+
+
+def bench_solver(game_num=2, max_move_num=80, playout_num=200):
+    '''自我对弈`game_num`局, 每局威胁空间搜索证明的叶节点数, 即省下的网络评估次数'''
+    net = make_net()
+    print('MCT threat solver on {0}x{0}, {1} playouts'.format(utils.SIZE, playout_num))
+    for game in range(game_num):
+        for solver in (False, True):
+            np.random.seed(game)
+            counting_net = CountingNet(net)
+            board = Board()
+            tree = MCT(board, net=counting_net, solver=solver)
+            tree.max_evaluate_time = playout_num
+            solved, evaluations, start_time = 0, 0, time()
+            while board.winner == utils.EMPTY and len(board.move_history) < max_move_num:
+                tree.play()
+                solved += tree.stats.solved
+                evaluations += tree.stats.evaluations
+                index = tree.get_move(tree.get_move_probability())
+                board.move(index)
+                board.judge_win(index)
+                board.round_change(1)
+                tree.update_one(index)
+            print('  game {}, {:<6}: {:>3} moves, {:>6} solved, {:>6} evals, {:>6} net, {:>6.1f} sec'.format(
+                game, 'solver' if solver else 'none', len(board.move_history), solved, evaluations,
+                counting_net.count, time() - start_time))
+
+
+def bench_pattern(board_num=50, move_nums=(40, 80, 120), repeat=10):
+    '''棋形识别在随机中盘局面上的速度: 整盘识别与落子后增量更新'''
+    print('PatternTable on {0}x{0}'.format(utils.SIZE))
+    for move_num in move_nums:
+        boards = [random_board(move_num, seed=seed) for seed in range(board_num)]
+        tables = [PatternTable(board) for board in boards]
+        refresh_rate = rate(PatternTable.refresh, [(table,) for table in tables], repeat)
+        cases = [(table, table.board.move_history[-1]) for table in tables]
+        update_rate = rate(PatternTable.update, cases, repeat)
+        print('  move {:>3}: refresh {:>8.0f}/sec, update {:>8.0f}/sec'.format(move_num, refresh_rate, update_rate))
+
+
+def bench_forbidden(board_num=50, move_nums=(40, 80, 120)):
+    '''黑棋禁手整盘判断的速度, 分别计首次计算与命中缓存'''
+    print('ForbiddenDetector.get_mask on {0}x{0}'.format(utils.SIZE))
+    for move_num in move_nums:
+        detector = ForbiddenDetector()
+        cases = [(detector, random_board(move_num, seed=seed)) for seed in range(board_num)]
+        first_rate = rate(ForbiddenDetector.get_mask, cases)
+        cached_rate = rate(ForbiddenDetector.get_mask, cases, 10)
+        print('  move {:>3}: first {:>8.0f}/sec, cached {:>8.0f}/sec'.format(move_num, first_rate, cached_rate))
+
+
+BENCHMARKS = {
+    'judge_win': bench_judge_win,
+    'playout': bench_playout,
+    'tree': bench_tree,
+    'batch': bench_batch,
+    'threads': bench_threads,
+    'processes': bench_processes,
+    'transposition': bench_transposition,
+    'cache': bench_cache,
+    'memory': bench_memory,
+    'solver': bench_solver,
+    'lazy': bench_lazy,
+    'near': bench_near,
+    'collect': bench_collect,
+    'async': bench_async,
+    'pattern': bench_pattern,
+    'forbidden': bench_forbidden
+}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('names', nargs='*', default=sorted(BENCHMARKS),
+                        help='benchmarks to run: {}'.format(', '.join(sorted(BENCHMARKS))))
+    parser.add_argument('--model', type=int, default=None,
+                        help='model num of the net used by search benchmarks')
+    args = parser.parse_args()
+    global MODEL_NUM
+    MODEL_NUM = args.model
+    for name in args.names:
+        BENCHMARKS[name]()
+
+if __name__ == '__main__':
+    main()
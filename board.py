@@ -3,12 +3,110 @@ from __future__ import division
 from __future__ import unicode_literals
 from __future__ import print_function
 
+from copy import deepcopy
+
 import numpy as np
 import utils
 
+LINE_TABLES = {}
+
+def get_line_table(size):
+    '''获取`size * size`棋盘的线表, 同尺寸的棋盘共享一份
+
+    线按 行, 列, 对角线, 反对角线 依次编号, 共`6 * size - 2`条.
+    `table[index]`为`index`所在四条线的`(线编号, 位掩码)`, 位序为该格沿线的位置.
+    '''
+    if size not in LINE_TABLES:
+        diag_base = 2 * size
+        back_diag_base = diag_base + 2 * size - 1
+        table = []
+        for index in range(size ** 2):
+            x, y = index % size, index // size
+            table.append((
+                (y, 1 << x),
+                (size + x, 1 << y),
+                (diag_base + x - y + size - 1, 1 << y),
+                (back_diag_base + x + y, 1 << y)
+                ))
+        LINE_TABLES[size] = (6 * size - 2, tuple(table))
+    return LINE_TABLES[size]
+
+SEGMENT_TABLES = {}
+DIRECTIONS = ((1, 0), (0, 1), (1, 1), (-1, 1))     # 行, 列, 对角线, 反对角线, 以`(dx, dy)`表示
+
+def get_segment_table(size, reach=utils.WIN_NUM - 1):
+    '''获取`size * size`棋盘的线段表, 同尺寸的棋盘共享一份
+
+    `table[index, direction]`为`index`沿`DIRECTIONS[direction]`前后各`reach`格的序号,
+    共`2 * reach + 1`个, 中间为`index`本身, 棋盘外的格记为`size ** 2`.
+    '''
+    if (size, reach) not in SEGMENT_TABLES:
+        full_size = size ** 2
+        y, x = np.divmod(np.arange(full_size), size)
+        offset = np.arange(-reach, reach + 1)
+        table = np.empty((full_size, len(DIRECTIONS), offset.size), np.intp)
+        for direction, (dx, dy) in enumerate(DIRECTIONS):
+            line_x = x[:, np.newaxis] + dx * offset
+            line_y = y[:, np.newaxis] + dy * offset
+            inside = (line_x >= 0) & (line_x < size) & (line_y >= 0) & (line_y < size)
+            table[:, direction] = np.where(inside, line_x + line_y * size, full_size)
+        table.setflags(write=False)
+        SEGMENT_TABLES[(size, reach)] = table
+    return SEGMENT_TABLES[(size, reach)]
+
+NEAR_TABLES = {}
+
+def get_near_table(size, radius=utils.NEAR_RADIUS):
+    '''获取`size * size`棋盘的邻域表, 同尺寸同半径的棋盘共享一份
+
+    `table[index]`为横纵距离都不超过`radius`的格的序号(含`index`本身), 共`(2 * radius + 1) ** 2`个,
+    棋盘外的格记为`size ** 2`.
+    '''
+    if (size, radius) not in NEAR_TABLES:
+        full_size = size ** 2
+        y, x = np.divmod(np.arange(full_size), size)
+        offset_y, offset_x = np.divmod(np.arange((2 * radius + 1) ** 2), 2 * radius + 1)
+        near_x = x[:, np.newaxis] + offset_x - radius
+        near_y = y[:, np.newaxis] + offset_y - radius
+        inside = (near_x >= 0) & (near_x < size) & (near_y >= 0) & (near_y < size)
+        table = np.where(inside, near_x + near_y * size, full_size)
+        table.setflags(write=False)
+        NEAR_TABLES[(size, radius)] = table
+    return NEAR_TABLES[(size, radius)]
+
+ZOBRIST_TABLES = {}
+
+def get_zobrist_table(size, seed=utils.ZOBRIST_SEED):
+    '''获取`size * size`棋盘的Zobrist随机数表, 给定`seed`时跨进程一致
+
+    返回`(piece, side)`, `piece[color][index]`为该色棋子在`index`处的64位键,
+    `side`为白方行棋时异或的键.
+    '''
+    if (size, seed) not in ZOBRIST_TABLES:
+        rng = np.random.RandomState(seed)
+        keys = np.frombuffer(rng.bytes(8 * (2 * size ** 2 + 1)), '<u8').tolist()
+        piece = {
+            utils.BLACK: tuple(keys[:size ** 2]),
+            utils.WHITE: tuple(keys[size ** 2:2 * size ** 2])
+        }
+        ZOBRIST_TABLES[(size, seed)] = (piece, keys[-1])
+    return ZOBRIST_TABLES[(size, seed)]
+
+def has_run(bits, length):
+    '''判断位串`bits`中是否有连续`length`个1'''
+    for _ in range(length - 1):
+        bits &= bits >> 1
+    return bits != 0
+
+def has_exact_run(bits, length):
+    '''判断位串`bits`中是否有恰好连续`length`个1, 两端都不再是1'''
+    start = bits
+    for _ in range(length - 1):
+        start &= start >> 1
+    return start & ~(bits << 1) & ~(bits >> length) != 0
+
 class Board(object):
     '''棋盘类'''
-    WIN_PATTERN = np.ones(utils.WIN_NUM, np.int)
 
     def __init__(self, size=utils.SIZE):
         self.winner = utils.EMPTY
@@ -16,16 +114,48 @@ class Board(object):
         self.round_num = 0
         self.size = size
         self.full_size = size ** 2
+        self.renju = utils.RENJU        # 连珠规则下黑棋长连不算胜
         self.board = np.zeros(self.full_size, np.int8)
         self.board_history_length = utils.BOARD_HISTORY_LENGTH
         self.feature_channels = utils.FEATURE_CHANNEL
-        self.black_board_history = [np.zeros(self.full_size, dtype=np.int8)] * self.board_history_length
-        self.white_board_history = [np.zeros(self.full_size, dtype=np.int8)] * self.board_history_length
+        self.move_history = []          # 双方交替的落子序列, 黑先
+        self.line_num, self.cell_lines = get_line_table(size)
+        self.segment_table = get_segment_table(size)
+        self.line_bits = {
+            utils.BLACK: [0] * self.line_num,
+            utils.WHITE: [0] * self.line_num
+        }
+        self.zobrist_piece, self.zobrist_side = get_zobrist_table(size)
+        self._zobrist_key = 0
+        # 双方视角的网络输入, 前半为己方最近几步后的棋子, 后半为对方的, 均由旧到新
+        self.feature_planes = {
+            utils.BLACK: np.zeros((size, size, self.feature_channels), np.float32),
+            utils.WHITE: np.zeros((size, size, self.feature_channels), np.float32)
+        }
+        # 空位集合: `empty_index[:empty_num]`为全部空位, `empty_where[index]`为其在数组中的位置
+        self.empty_index = np.arange(self.full_size)
+        self.empty_where = np.arange(self.full_size)
+        self.empty_num = self.full_size
+        self.legal_mask = np.ones(self.full_size, np.bool_)
+        # 邻近计数: `near_count[index]`为`index`周围`near_radius`格内的棋子数, 末位供棋盘外的序号使用
+        self.near_radius = utils.NEAR_RADIUS
+        self.near_table = get_near_table(size, self.near_radius)
+        self.near_count = np.zeros(self.full_size + 1, np.int16)
+
+    # 按棋盘大小共享的只读查表, 复制棋盘时不复制
+    SHARED_TABLES = ('cell_lines', 'segment_table', 'zobrist_piece', 'near_table')
+
+    def __deepcopy__(self, memo):
+        '''复制棋盘状态, 只读查表与原棋盘共享'''
+        board = self.__class__.__new__(self.__class__)
+        memo[id(self)] = board
+        for key, value in self.__dict__.items():
+            board.__dict__[key] = value if key in self.SHARED_TABLES else deepcopy(value, memo)
+        return board
 
     def __del__(self):
         del self.board
-        del self.black_board_history
-        del self.white_board_history
+        del self.move_history
 
     def xy2index(self, move):
         '''将坐标`(x, y)`变为序号`index`'''
@@ -57,71 +187,124 @@ class Board(object):
         else:
             return self.board[(x + y - self.size + 2) * self.size - 1:self.full_size:self.size - 1]
 
+    def get_segments(self, indices=None):
+        '''获取`indices`处(默认为全部格)四个方向的线段, 形如`(len(indices), 4, 2 * WIN_NUM - 1)`,
+        棋盘外记为`utils.WALL`
+        '''
+        padded = np.append(self.board, np.int8(utils.WALL))
+        if indices is None:
+            return padded[self.segment_table]
+        return padded[self.segment_table[indices]]
+
     def judge_win(self, index):
-        '''检查`(x, y)`周围情况, 判断是否获胜'''
-        color = self.board[index]
-        target = utils.WIN_NUM * color
-        x, y = index % self.size, index // self.size
-        lines = [self.row(y), self.col(x), self.diag(x, y), self.back_diag(x, y)]
-        for line in lines:
-            if line.size < utils.WIN_NUM:
-                continue
-            else:
-                if target  in np.correlate(line, self.WIN_PATTERN):
-                    self.winner = self.now_color
-                    return True
+        '''检查`index`处棋子所在的四条线, 判断是否获胜'''
+        color = int(self.board[index])
+        if color == utils.EMPTY:
+            return False
+
+        bits = self.line_bits[color]
+        judge = has_exact_run if self.renju and color == utils.BLACK else has_run
+        for line, _ in self.cell_lines[index]:
+            if judge(bits[line], utils.WIN_NUM):
+                self.winner = color
+                return True
 
         return False
 
     def judge_round_up(self):
-        return np.all(self.board)
+        return self.empty_num == 0
 
     def move(self, index):
         assert 0 <= index < self.full_size, 'index out of range'
         assert self.board[index] == utils.EMPTY, 'target is not empty'
         self.board[index] = self.now_color
-
-        if self.now_color is utils.BLACK:
-            self.black_board_history.append(self.black_board)
-        else:
-            self.white_board_history.append(self.white_board)
+        self.move_history.append(index)
+        self.legal_mask[index] = False
+
+        # 与最后一个空位交换后移出, 撤销时按相反顺序恢复即可
+        self.empty_num -= 1
+        where, last = self.empty_where[index], self.empty_index[self.empty_num]
+        self.empty_index[where], self.empty_index[self.empty_num] = last, index
+        self.empty_where[last], self.empty_where[index] = where, self.empty_num
+        self._zobrist_key ^= self.zobrist_piece[self.now_color][index]
+        self.near_count[self.near_table[index]] += 1
+
+        bits = self.line_bits[self.now_color]
+        for line, mask in self.cell_lines[index]:
+            bits[line] |= mask
+
+        y, x = divmod(index, self.size)
+        length = self.board_history_length
+        for planes in (
+                self.feature_planes[self.now_color][:, :, :length],
+                self.feature_planes[-self.now_color][:, :, length:]
+            ):
+            planes[:, :, :-1] = planes[:, :, 1:]
+            planes[y, x, -1] = 1
 
     def undo(self):
-        if self.now_color is utils.BLACK:
-            if len(self.black_board_history) > self.board_history_length:
-                self.board = self.black_board_history.pop() * utils.BLACK\
-                + self.white_board_history[-1] * utils.WHITE
-        else:
-            if len(self.white_board_history) > self.board_history_length:
-                self.board = self.black_board_history[-1] * utils.BLACK\
-                + self.white_board_history.pop() * utils.WHITE
-
-        self.round_change(-1)
+        '''撤销最后一步棋, 轮次回到该步落子前'''
+        assert self.move_history, 'no move to undo'
+        index = self.move_history.pop()
+        color = int(self.board[index])
+        self.board[index] = utils.EMPTY
+        self.legal_mask[index] = True
+        self.empty_num += 1
+        self._zobrist_key ^= self.zobrist_piece[color][index]
+        self.near_count[self.near_table[index]] -= 1
+
+        bits = self.line_bits[color]
+        for line, mask in self.cell_lines[index]:
+            bits[line] ^= mask
+
+        # 移出的最旧一层比新的最旧一层多该方更早的一步, 其余各层右移
+        length = self.board_history_length
+        oldest = len(self.move_history) - 2 * (length - 1)
+        for planes in (
+                self.feature_planes[color][:, :, :length],
+                self.feature_planes[-color][:, :, length:]
+            ):
+            planes[:, :, 1:] = planes[:, :, :-1]
+            if oldest >= 0:
+                y, x = divmod(self.move_history[oldest], self.size)
+                planes[y, x, 0] = 0
 
+        self.winner = utils.EMPTY
+        self.round_change(len(self.move_history) - self.round_num)
 
     def get_feature(self, color, round_num=None):
+        '''获取`color`方第`round_num`步时的网络输入
+
+        不给出`round_num`且`color`为当前行棋方时, 直接返回维护中的float32特征的视图,
+        其内容会随之后的`move`/`undo`改变, 需要保留时请自行复制.
+        '''
         if round_num is None:
+            if color == self.now_color:
+                return self.feature_planes[color][np.newaxis]
             round_num = self.round_num // 2
 
-        if color is utils.BLACK:
-            return np.array(
-                self.black_board_history[round_num:round_num + self.board_history_length]\
-                + self.white_board_history[round_num:round_num + self.board_history_length],
-                dtype=np.int8
-                ).reshape(
-                    (1, self.feature_channels, self.size, self.size)
-                ).transpose((0, 2, 3, 1))
-        elif color is utils.WHITE:
-            return np.array(
-                self.white_board_history[round_num:round_num + self.board_history_length]\
-                + self.black_board_history[round_num + 1:round_num + 1 + self.board_history_length],
-                dtype=np.int8
-                ).reshape(
-                    (1, self.feature_channels, self.size, self.size)
-                ).transpose((0, 2, 3, 1))
-        else:
+        if color not in [utils.BLACK, utils.WHITE]:
             raise AttributeError('given color is not black or white')
 
+        # 由落子序列重建: 己方取前`round_num`步, 对方为黑时多算这一步
+        length = self.board_history_length
+        black_moves, white_moves = self.move_history[0::2], self.move_history[1::2]
+        if color == utils.BLACK:
+            histories = ((0, black_moves, round_num), (length, white_moves, round_num))
+        else:
+            histories = ((0, white_moves, round_num), (length, black_moves, round_num + 1))
+
+        feature = np.zeros((self.feature_channels, self.full_size), np.int8)
+        for offset, moves, last in histories:
+            for channel in range(length):
+                move_num = last - length + 1 + channel
+                if move_num > 0:
+                    feature[offset + channel, moves[:move_num]] = 1
+
+        return feature.reshape(
+            (1, self.feature_channels, self.size, self.size)
+            ).transpose((0, 2, 3, 1))
+
     def get_color_board(self, color, board=None):
         if board is None:
             board = self.board
@@ -144,7 +327,15 @@ class Board(object):
 
     def round_change(self, num):
         self.round_num += num
-        self.now_color = (-1) ** self.round_num
+        color = (-1) ** self.round_num
+        if color != self.now_color:
+            self._zobrist_key ^= self.zobrist_side
+        self.now_color = color
+
+    @property
+    def zobrist_key(self):
+        '''当前局面(含行棋方)的64位Zobrist键'''
+        return self._zobrist_key
 
     @property
     def show_board(self):
@@ -158,17 +349,136 @@ class Board(object):
     def white_board(self):
         return self.get_color_board(utils.WHITE)
 
+    @property
+    def near_mask(self):
+        '''距已有棋子横纵都不超过`near_radius`格的空位, 棋盘上无子时为全部空位'''
+        if not self.move_history:
+            return self.legal_mask.copy()
+        return (self.near_count[:-1] > 0) & self.legal_mask
+
+    def set_near_radius(self, radius):
+        '''改变邻近半径, 并按现有棋子重新计数'''
+        self.near_radius = radius
+        self.near_table = get_near_table(self.size, radius)
+        self.near_count.fill(0)
+        for index in self.move_history:
+            self.near_count[self.near_table[index]] += 1
+
     @property
     def empty_pos(self):
-        return np.where(self.board == utils.EMPTY)[0]
+        '''全部空位, 为内部数组的视图, 顺序不固定'''
+        return self.empty_index[:self.empty_num]
 
     def reset(self):
         self.winner = utils.EMPTY
         self.now_color = utils.BLACK
         self.round_num = 0
         self.board = np.zeros(self.full_size, np.int8)
-        self.black_board_history = [np.zeros(self.full_size, dtype=np.int8)] * self.board_history_length
-        self.white_board_history = [np.zeros(self.full_size, dtype=np.int8)] * self.board_history_length
+        self.move_history = []
+        self.line_bits = {
+            utils.BLACK: [0] * self.line_num,
+            utils.WHITE: [0] * self.line_num
+        }
+        self._zobrist_key = 0
+        for planes in self.feature_planes.values():
+            planes.fill(0)
+        self.empty_index = np.arange(self.full_size)
+        self.empty_where = np.arange(self.full_size)
+        self.empty_num = self.full_size
+        self.legal_mask.fill(True)
+        self.near_count.fill(0)
+
+
+class BoardBatch(object):
+    '''`num`盘棋同存于一个数组, 落子, 判断胜负, 生成特征均对所有盘一次完成
+
+    大部分方法的`games`为参与的盘序号, 默认为全部, 其余参数与之一一对应.
+    '''
+    def __init__(self, num, size=utils.SIZE):
+        self.num = num
+        self.size = size
+        self.full_size = size ** 2
+        self.renju = utils.RENJU
+        self.board_history_length = utils.BOARD_HISTORY_LENGTH
+        self.feature_channels = utils.FEATURE_CHANNEL
+        self.all_games = np.arange(num)
+        self.win_table = get_segment_table(size, utils.WIN_NUM)
+        # 最后一列恒为`WALL`, 供线段表中棋盘外的序号使用
+        self.padded_board = np.full((num, self.full_size + 1), utils.WALL, np.int8)
+        self.board = self.padded_board[:, :-1]
+        # `history[game, side]`为黑(0)白(1)最近几步后的棋子, 由旧到新
+        self.history = np.zeros((num, 2, self.board_history_length, self.full_size), np.int8)
+        self.now_color = np.empty(num, np.int8)
+        self.round_num = np.empty(num, np.int64)
+        self.winner = np.empty(num, np.int8)
+        self.empty_num = np.empty(num, np.int64)
+        self.reset()
+
+    def select(self, games):
+        return self.all_games if games is None else np.asarray(games, np.intp)
+
+    def move(self, indices, games=None):
+        games, indices = self.select(games), np.asarray(indices, np.intp)
+        assert ((0 <= indices) & (indices < self.full_size)).all(), 'index out of range'
+        assert (self.board[games, indices] == utils.EMPTY).all(), 'target is not empty'
+        color = self.now_color[games]
+        self.board[games, indices] = color
+        self.empty_num[games] -= 1
+
+        side = (color == utils.WHITE).astype(np.intp)
+        history = self.history[games, side]
+        history[:, :-1] = history[:, 1:]
+        history[np.arange(games.size), -1, indices] = 1
+        self.history[games, side] = history
+
+    def judge_win(self, indices, games=None):
+        '''检查各盘`indices`处棋子所在的四条线, 返回各盘是否获胜'''
+        games, indices = self.select(games), np.asarray(indices, np.intp)
+        color = self.board[games, indices]
+        segments = self.padded_board[games[:, np.newaxis, np.newaxis], self.win_table[indices]]
+        own = (segments == color[:, np.newaxis, np.newaxis]) & (color != utils.EMPTY)[:, np.newaxis, np.newaxis]
+        exact = (self.renju & (color == utils.BLACK))[:, np.newaxis]
+
+        win_num, center = utils.WIN_NUM, utils.WIN_NUM
+        five = np.zeros(own.shape[:2], np.bool_)
+        for start in range(center - win_num + 1, center + 1):
+            window = own[..., start:start + win_num].all(axis=-1)
+            closed = ~own[..., start - 1] & ~own[..., start + win_num]
+            five |= window & (closed | ~exact)
+
+        win = five.any(axis=1)
+        self.winner[games[win]] = color[win]
+        return win
+
+    def judge_round_up(self, games=None):
+        return self.empty_num[self.select(games)] == 0
+
+    def round_change(self, num, games=None):
+        games = self.select(games)
+        self.round_num[games] += num
+        self.now_color[games] = np.where(self.round_num[games] % 2, utils.WHITE, utils.BLACK)
+
+    def get_feature(self, games=None):
+        '''各盘当前行棋方的网络输入, 形如`(len(games), size, size, FEATURE_CHANNEL)`'''
+        games = self.select(games)
+        side = (self.now_color[games] == utils.WHITE).astype(np.intp)
+        feature = np.concatenate(
+            (self.history[games, side], self.history[games, 1 - side]), axis=1
+            ).reshape((games.size, self.feature_channels, self.size, self.size))
+        return feature.transpose((0, 2, 3, 1)).astype(np.float32)
+
+    @property
+    def legal_mask(self):
+        return self.board == utils.EMPTY
+
+    def reset(self, games=None):
+        games = self.select(games)
+        self.board[games] = utils.EMPTY
+        self.history[games] = 0
+        self.now_color[games] = utils.BLACK
+        self.round_num[games] = 0
+        self.winner[games] = utils.EMPTY
+        self.empty_num[games] = self.full_size
 
 
 if __name__ == '__main__':
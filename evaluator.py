@@ -0,0 +1,227 @@
+# -*- coding:utf-8 -*-
+"""Evaluators sitting between the search and `Net`, turning single position requests into
+batched `Net.get_predicts_and_values` calls.
+"""
+from __future__ import division
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import sys
+import asyncio
+import threading
+from time import time
+
+import numpy as np
+import utils
+from utils.lru import LRUCache, measure_entry_bytes
+from net import generate_matrix_trans
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+
+class Request(object):
+    """A position waiting for its evaluation."""
+    def __init__(self, feature):
+        self.feature = feature
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class BatchEvaluator(object):
+    """Shared evaluator for search threads. `evaluate` blocks the calling thread while a background
+    thread gathers pending requests, until `batch_size` of them are waiting or `timeout` seconds
+    passed since the first, and runs them through the net at once. TensorFlow releases the GIL
+    inside `sess.run`, so the other threads keep searching meanwhile.
+    """
+    def __init__(self, net, batch_size, timeout=utils.EVALUATOR_TIMEOUT):
+        self.net = net
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.queue = Queue()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def evaluate(self, feature):
+        """Returns the policy and value of one feature of shape `(SIZE, SIZE, FEATURE_CHANNEL)`."""
+        request = Request(feature)
+        self.queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def run(self):
+        closing = False
+        while not closing:
+            request = self.queue.get()
+            if request is None:
+                break
+
+            batch = [request]
+            deadline = time() + self.timeout
+            while len(batch) < self.batch_size:
+                try:
+                    request = self.queue.get(timeout=max(deadline - time(), 0))
+                except Empty:
+                    break
+                if request is None:
+                    closing = True
+                    break
+                batch.append(request)
+
+            try:
+                predicts, values = self.net.get_predicts_and_values(
+                    np.stack([request.feature for request in batch])
+                    )
+                for request, predict, value in zip(batch, predicts, values):
+                    request.result = (predict, value)
+            except Exception as error:
+                for request in batch:
+                    request.error = error
+            for request in batch:
+                request.done.set()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
+class AsyncEvaluator(object):
+    """Shared evaluator for searches running as coroutines on one event loop, see `AsyncMCT`.
+    Awaiting `evaluate` suspends the search while the requests of all searches gather, until
+    `batch_size` of them are waiting or `timeout` seconds passed since the first, and runs them
+    through the net as one batch. The net is called on the loop itself, no thread is involved.
+    With `cache` the net is put behind a `CachedNet` shared by all the searches.
+    """
+    def __init__(self, net, batch_size=utils.ASYNC_BATCH_SIZE, timeout=utils.EVALUATOR_TIMEOUT,
+                 cache=utils.MCTS_EVAL_CACHE):
+        self.net = CachedNet(net) if cache else net
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.pending = []       # (feature, future) of the requests waiting for the next batch
+        self.timer = None
+        self.batch_num = 0
+        self.request_num = 0
+
+    async def evaluate(self, feature):
+        """Returns the policy and value of one feature of shape `(SIZE, SIZE, FEATURE_CHANNEL)`."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((feature, future))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.timeout, self.flush)
+        return await future
+
+    def flush(self):
+        """Evaluate every pending request now."""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+
+        try:
+            predicts, values = self.net.get_predicts_and_values(np.stack([feature for feature, _ in batch]))
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        self.batch_num += 1
+        self.request_num += len(batch)
+        for (_, future), predict, value in zip(batch, predicts, values):
+            if not future.done():
+                future.set_result((predict, value))
+
+    @property
+    def mean_batch_size(self):
+        return self.request_num / self.batch_num if self.batch_num else 0.0
+
+    def get_model_num(self):
+        return self.net.get_model_num()
+
+
+class CachedNet(object):
+    """LRU cache of policies and values in front of a net. Positions are keyed by their feature
+    under the one of the 8 board symmetries giving the smallest key, so symmetric positions share
+    an entry. The cached policy is kept in that canonical orientation and turned back through the
+    inverse symmetry on a hit. At most `size` entries are kept.
+    """
+    def __init__(self, net, size=utils.EVAL_CACHE_SIZE):
+        self.net = net
+        self.size = size
+        self.cache = LRUCache(size)
+        self.rot, self.rot_inverse = generate_matrix_trans()
+        self.hit = 0
+        self.miss = 0
+        self.entry_bytes = self.get_entry_bytes()
+
+    def get_entry_bytes(self, full_size=utils.FULL_SIZE):
+        """Approximate bytes of one entry: its key, the policy and value, and the LRU bookkeeping."""
+        key = np.packbits(np.zeros(full_size * utils.FEATURE_CHANNEL, np.bool_)).tobytes()
+        predict = np.zeros(full_size, np.float32)
+        value = np.float32(0)
+        return (sys.getsizeof(key) + sys.getsizeof(predict) + sys.getsizeof(value)
+                + sys.getsizeof((predict, value)) + measure_entry_bytes())
+
+    def limit_memory(self, max_bytes):
+        """Keep the entries within about `max_bytes`, None for the `size` alone."""
+        self.cache.limit_memory(max_bytes, self.entry_bytes)
+
+    def canonical(self, feature):
+        """Returns the key and the symmetry of a feature of shape `(SIZE, SIZE, FEATURE_CHANNEL)`."""
+        keys = [np.packbits(self.rot[rot_num](feature) > 0).tobytes() for rot_num in range(len(self.rot))]
+        rot_num = min(range(len(keys)), key=keys.__getitem__)
+        return keys[rot_num], rot_num
+
+    def turn(self, predict, rot):
+        size = int(np.sqrt(predict.size))
+        return rot(predict.reshape(size, size)).reshape(-1)
+
+    def get_predict_and_value(self, feature):
+        predicts, values = self.get_predicts_and_values(feature)
+        return predicts[0], values[0]
+
+    def get_predicts_and_values(self, features):
+        features = np.asarray(features)
+        canonicals = [self.canonical(feature) for feature in features]
+        results = [None] * len(features)
+        missing = []
+        for num, (key, rot_num) in enumerate(canonicals):
+            cached = self.cache.get(key)
+            if cached is None:
+                missing.append(num)
+            else:
+                results[num] = (self.turn(cached[0], self.rot_inverse[rot_num]), cached[1])
+        self.hit += len(features) - len(missing)
+        self.miss += len(missing)
+
+        if missing:
+            predicts, values = self.net.get_predicts_and_values(features[missing])
+            for num, predict, value in zip(missing, predicts, values):
+                key, rot_num = canonicals[num]
+                self.cache.put(key, (self.turn(predict, self.rot[rot_num]).copy(), value))
+                results[num] = (predict, value)
+
+        return np.array([predict for predict, _ in results]), np.array([value for _, value in results])
+
+    @property
+    def hit_rate(self):
+        total = self.hit + self.miss
+        return self.hit / total if total else 0.0
+
+    def clear(self):
+        self.cache.clear()
+        self.hit = 0
+        self.miss = 0
+
+    def get_model_num(self):
+        return self.net.get_model_num()
@@ -5,6 +5,7 @@ from __future__ import division
 
 import os
 import time
+import asyncio
 import utils
 from utils.logger import Logger
 from player import player_generate
@@ -19,9 +20,10 @@ class Game(object):
 
     def __init__(self, black_player_type=utils.RANDOM,
                  white_player_type=utils.RANDOM, size=utils.SIZE,
-                 black_net_model_num=None, white_net_model_num=None):
+                 black_net_model_num=None, white_net_model_num=None, evaluator=None):
         self.logger.info('Start new game. Board size: {} * {}'.format(size, size))
         self.board = Board(size)
+        self.evaluator = evaluator      # 给出`AsyncEvaluator`时, MCTS玩家用它搜索, 见`start_async`
         self.black_player = player_generate(
             black_player_type,
             utils.BLACK,
@@ -67,7 +69,7 @@ class Game(object):
             self.logger.warning('That is the first round')
 
     def round_process(self, index=None):
-        if not index:
+        if index is None:
             if self.now_player.player_type is not utils.GOMOCUP:
                 index = self.now_player.get_move()
             else:
@@ -88,6 +90,13 @@ class Game(object):
         while self.run:
             self.round_process()
 
+    async def start_async(self):
+        '''在事件循环中下完一局, 多局可以并发, 共用同一个`AsyncEvaluator`'''
+        while self.run:
+            if self.now_player.player_type is utils.GOMOCUP:
+                raise AttributeError('gomocup player does not get move')
+            self.round_process(await self.now_player.get_move_async())
+
     def reset(self, black_player_type=None, white_player_type=None):
         self.run = True
         self.history = list()
@@ -103,7 +112,6 @@ class Game(object):
         else:
             self.white_player.reset()
 
-        utils.CLEAR()
         self.logger.info('Reset game')
 
     def game_over(self):
@@ -189,6 +197,10 @@ def main():
         game = Game()
         game.start()
 
+async def play_games(games):
+    '''在同一个事件循环中并发下完`games`中的各局'''
+    await asyncio.gather(*(game.start_async() for game in games))
+
 def compare(compare_model_num=None, default_model_num=None):
     if utils.USE_PAI:
         if compare_model_num is None:
@@ -9,7 +9,7 @@ from game import Game
 class Gomocup(object):
     logger = Logger('gomocup')
 
-    def __init__(self, size=None):
+    def __init__(self, size=None, model_num=None):
         self.get_board = False
         self.board_queue = Queue()
         self.end = False
@@ -17,32 +17,69 @@ class Gomocup(object):
         self.begin = False
         self.robot_color = None
         self.size = size
+        self.model_num = model_num      # 己方MCTS棋手的网络模型
         self.game = None
         self.messages = list()
+        self.info = dict()
 
     def start_game(self, color):
         if self.start:
             self.begin = True
             self.robot_color = color
             if color is utils.BLACK:
-                self.game = Game(white_player_type=utils.GOMOCUP, size=self.size)
+                self.game = Game(utils.MCTS, utils.GOMOCUP, self.size, black_net_model_num=self.model_num)
             else:
-                self.game = Game(black_player_type=utils.GOMOCUP, size=self.size)
+                self.game = Game(utils.GOMOCUP, utils.MCTS, self.size, white_net_model_num=self.model_num)
             self.logger.info('begin play as {}'.format(utils.COLOR[self.robot_color]))
+            self.apply_info()
         else:
             raise AttributeError('game has not started')
 
+    def apply_info(self):
+        '''将管理器`INFO`给出的限制用于搜索: 每步时限`timeout_turn`(毫秒)留出余量与延长时间后
+        代替playout数的限制, 内存上限`max_memory`(字节)按比例留给搜索树与缓存'''
+        if self.game is None:
+            return
+        for player in (self.game.black_player, self.game.white_player):
+            if not hasattr(player, 'mct'):
+                continue
+            if int(self.info.get('timeout_turn', 0)) > 0:
+                player.mct.max_evaluate_time = None
+                player.mct.time_limit = (
+                    int(self.info['timeout_turn']) / 1000 * utils.GOMOCUP_TIME_RATE
+                    / (1 + utils.MCTS_TIME_EXTEND)
+                    )
+            if int(self.info.get('max_memory', 0)) > 0:
+                player.mct.max_memory = int(int(self.info['max_memory']) * utils.GOMOCUP_MEMORY_RATE)
+
     def move(self, move=None):
+        '''己方落子, 给出坐标`(x, y)`时按其落子, 否则由己方棋手搜索, 返回坐标'''
         if move:
-            self.game.round_process(move)
+            self.game.round_process(self.game.board.xy2index(utils.Move(*move)))
         else:
-            move = self.game.round_process()
+            move = self.game.board.index2xy(self.game.round_process())
+            self.ponder()
         self.logger.info('{}: ({},{})'.format(utils.COLOR[self.robot_color], *move))
         return move
 
+    def robot_player(self):
+        if self.robot_color is utils.BLACK:
+            return self.game.black_player
+        return self.game.white_player
+
+    def ponder(self):
+        '''回复落子后, 让支持的己方棋手利用对方的时间继续搜索'''
+        player = self.robot_player()
+        if utils.MCTS_PONDER and hasattr(player, 'ponder'):
+            player.ponder()
+
+    def stop_ponder(self):
+        if self.game is not None and hasattr(self.robot_player(), 'mct'):
+            self.robot_player().mct.stop_ponder()
+
     def oppo_move(self, move=None):
         if move:
-            self.game.round_process(move)
+            self.game.round_process(self.game.board.xy2index(utils.Move(*move)))
         else:
             raise AttributeError('gomocup player does not get move')
         self.logger.info('{}: ({},{})'.format(utils.COLOR[-self.robot_color], *move))
@@ -85,8 +122,7 @@ class Gomocup(object):
 
             elif cmds[0] == 'BEGIN':
                 self.start_game(utils.BLACK)
-                move = self.game.round_process()
-                self.logger.info('{}: ({},{})'.format(utils.COLOR[self.robot_color], *move))
+                move = self.move()
                 return '{},{}'.format(*move)
 
             elif cmds[0] == 'TURN':
@@ -100,7 +136,10 @@ class Gomocup(object):
 
             elif cmds[0] == 'RESTART':
                 self.logger.info('restart game')
-                self.__init__(self.size)
+                self.stop_ponder()
+                info = self.info
+                self.__init__(self.size, self.model_num)
+                self.info = info
                 self.start = True
                 return 'OK'
 
@@ -110,11 +149,15 @@ class Gomocup(object):
 
             elif cmds[0] == 'END':
                 self.logger.info('end')
+                self.stop_ponder()
                 self.end = True
                 return 'None'
 
             elif cmds[0] == 'INFO':
                 self.logger.info('recieve info %s' % ' '.join(cmds[1:]))
+                if len(cmds) > 2:
+                    self.info[cmds[1]] = cmds[2]
+                    self.apply_info()
                 return 'None'
 
             elif cmds[0] == 'BOARD':
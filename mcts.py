@@ -6,49 +6,59 @@ policy function, and value function.
 """
 from __future__ import unicode_literals
 from __future__ import print_function
+import sys
+import asyncio
+import threading
+import weakref
+import multiprocessing
 from copy import deepcopy
+from time import time
 
 import numpy as np
 import utils
-from utils.timeit import timeit_context
+from utils.logger import Logger
+from utils.lru import LRUCache, measure_entry_bytes
+from utils.telemetry import SearchStats, log_sink
 from scipy.stats import dirichlet
 from net import Net
 from board import Board
+from renju import ForbiddenDetector
+from solver import ThreatSolver, UNKNOWN
+from evaluator import BatchEvaluator, AsyncEvaluator, CachedNet
 
 
 class MCTNode(object):
     """A node in the MCTS tree. Each node keeps track of its own value Q, prior probability P, and
     its visit-count-adjusted prior score u.
+    A node owns its children, while the link to its parent is a weak reference, so the tree holds
+    no reference cycles and a subtree is freed by reference counting as soon as it is dropped.
     """
     def __init__(self, parent, prior_prob):
-        self.parent = parent
+        self.parent = parent    # weak, see the `parent` property
         self.children = {}      # a map from action
         self.P = prior_prob     # prior prob
         self.N = 0              # visit time
         self.W = 0              # total action value
         self.Q = 0              # mean action value
+        self.actions = None     # lazy expansion: actions by descending prior, children made in order
+        self.priors = None      # lazy expansion: priors of `actions`
 
-    def __del__(self):
-        del self.children
+    @property
+    def parent(self):
+        """The parent node, None for the root or once the parent has been freed."""
+        return self._parent() if self._parent is not None else None
 
-    def release_parent(self):
-        if self.parent and self.parent.children:
-            for child in self.parent.children.values():
-                if id(child) != id(self):
-                    child.release_children()
-                    del child
+    @parent.setter
+    def parent(self, parent):
+        self._parent = weakref.ref(parent) if parent is not None else None
 
-            del self.parent
+    def release_parent(self):
         self.parent = None
 
     def release_children(self):
-        if self.children:
-            for child in self.children.values():
-                child.release_children()
-                del child
-
-            del self.children
         self.children = {}
+        self.actions = None
+        self.priors = None
 
     def clear_to_root(self):
         self.release_parent()
@@ -58,49 +68,490 @@ class MCTNode(object):
         self.W = 0
         self.Q = 0
 
-    def get_Q_plus_U(self):
-        '''Q + U'''
-        return self.Q + utils.C_PUCT * self.P * (self.parent.N ** 0.5) / (1 + self.N)
+    def get_Q_plus_U(self, parent_N=None):
+        '''Q + U, `parent_N` is the visit count of the node selecting this one, its parent by default'''
+        if parent_N is None:
+            parent_N = self.parent.N
+        return self.Q + utils.C_PUCT * self.P * (parent_N ** 0.5) / (1 + self.N)
 
-    def expand(self, predict):
+    def expand(self, predict, lazy=False):
         """Expand tree by creating new children.
         Arguments:
         action_priors -- output from policy function - a list of tuples of actions and their prior
             probability according to the policy function.
+        lazy -- only keep the non-zero priors sorted, children are made by `select` when first chosen.
         Returns:
         None
         """
+        if lazy:
+            actions = np.flatnonzero(predict > 0)
+            self.actions = actions[np.argsort(-predict[actions], kind='stable')].astype(np.int16)
+            self.priors = predict[self.actions].astype(np.float32)
+            return
         for index, prob in enumerate(predict):
             if prob > 0:
                 self.children[index] = MCTNode(self, prob)
 
-    def select(self):
+    def select(self, limit=None):
         """Select action among children that gives maximum action value, Q plus bonus u(P).
+        After a lazy expansion the actions not yet made children all have Q = 0 and N = 0, so the
+        best of them is the next one by prior. It is made a child if it beats the existing ones
+        and fewer than `limit` children exist.
         Returns:
         A tuple of (action, next_node)
         """
-        return max(self.children.items(), key=lambda action_node: action_node[1].get_Q_plus_U())
+        best = None
+        if self.children:
+            best = max(self.children.items(), key=lambda action_node: action_node[1].get_Q_plus_U(self.N))
+        num = len(self.children)
+        if self.actions is not None and num < len(self.actions) and (limit is None or num < limit):
+            prior = float(self.priors[num])
+            if best is None or utils.C_PUCT * prior * (self.N ** 0.5) > best[1].get_Q_plus_U(self.N):
+                action = int(self.actions[num])
+                self.children[action] = MCTNode(self, prior)
+                return action, self.children[action]
+        return best
 
-    def backup(self, value):
-        """Update node values from leaf evaluation.
-        Arguments:
-        value -- the value of subtree evaluation from the current player's perspective.
-        c_puct -- a number in (0, inf) controlling the relative impact of values, Q, and
-            prior probability, P, on this node's score.
-        Returns:
-        None
+    def is_leaf(self):
+        return self.children == {} and self.actions is None
+
+
+def measure_node_bytes(num=utils.FULL_SIZE, lazy=False):
+    """Approximate bytes taken by one `MCTNode`, its attributes and its entry in the parent's
+    children dict, measured on a node expanded to `num` children. With `lazy`, the sorted priors
+    a lazily expanded node keeps for `num` actions are added.
+    """
+    node = MCTNode(None, 1.0)
+    node.expand(np.ones(num))
+    child = node.children[0]
+    child.N = child.W = child.Q = 0.0
+    node_bytes = sys.getsizeof(child) + sys.getsizeof(child.__dict__) + sys.getsizeof(child.children)
+    node_bytes += sys.getsizeof(child._parent)
+    node_bytes += sum(sys.getsizeof(value) for value in (child.P, child.N, child.W, child.Q))
+    node_bytes += sys.getsizeof(node.children) // num + sys.getsizeof(num)
+    if lazy:
+        child.expand(np.ones(num), lazy=True)
+        node_bytes += sys.getsizeof(child.actions) + sys.getsizeof(child.priors)
+    node.release_children()
+    return node_bytes
+
+
+class NodeTree(object):
+    """Tree backend made of linked `MCTNode` objects. Nodes are the `MCTNode`s themselves. Values
+    are backed up along the path a playout took, not the parent links, so a subtree may be shared
+    by several nodes reaching the same position, see `share`.
+    With `lazy`, an expansion keeps only the priors and children are made one at a time when first
+    selected. `widen_base` then allows at most `widen_base * (N + 1) ** widen_rate` children on a
+    node of N visits, None for no limit.
+    """
+    def __init__(self, lazy=False, widen_base=utils.MCTS_WIDEN_BASE, widen_rate=utils.MCTS_WIDEN_RATE):
+        self.root = MCTNode(None, 1.0)
+        self.lazy = lazy
+        self.widen_base = widen_base
+        self.widen_rate = widen_rate
+        self.node_bytes = measure_node_bytes(lazy=lazy)
+        self._size = 1
+        self.allocated = 0      # nodes created by expansions so far
+
+    @property
+    def size(self):
+        """Number of nodes in the tree, counted again after the root moves."""
+        if self._size is None:
+            self._size = len(self.get_nodes())
+        return self._size
+
+    @property
+    def memory(self):
+        """Approximate bytes taken by the nodes."""
+        return self.size * self.node_bytes
+
+    def get_nodes(self):
+        """All distinct nodes reachable from the root."""
+        nodes = {id(self.root): self.root}
+        stack = [self.root]
+        while stack:
+            for child in stack.pop().children.values():
+                if id(child) not in nodes:
+                    nodes[id(child)] = child
+                    stack.append(child)
+        return list(nodes.values())
+
+    def prune(self, target):
+        """Drop the children of the least visited expanded nodes until at most `target` nodes
+        are left. Their visit statistics are kept and they are expanded again when selected.
         """
-        if self.parent:
-            self.parent.backup(value)
+        while self.size > target:
+            expanded = sorted(
+                (node for node in self.get_nodes() if node.children and node is not self.root),
+                key=lambda node: node.N
+                )
+            if not expanded:
+                break
+            dropped = 0
+            for node in expanded:
+                if dropped >= self.size - target:
+                    break
+                dropped += len(node.children)
+                node.release_children()
+            self._size = None
 
-        # Update u, the prior weighted by an exploration hyperparameter c_puct and the number of
-        # visits. Note that u is not normalized to be a distribution.
-        self.N += 1.0
-        self.W += value
-        self.Q = self.W / self.N
+    def is_leaf(self, node):
+        return node.is_leaf()
+
+    def limit_capacity(self, node_limit):
+        """Nothing to do, nodes are allocated one at a time."""
+
+    def select(self, node):
+        if not self.lazy:
+            return node.select()
+        limit = None
+        if self.widen_base is not None:
+            limit = max(1, int(self.widen_base * (node.N + 1) ** self.widen_rate))
+        num = len(node.children)
+        action_node = node.select(limit)
+        if len(node.children) > num:
+            self.allocated += 1
+            if self._size is not None:
+                self._size += 1
+        return action_node
+
+    def expand(self, node, predict):
+        node.expand(predict, self.lazy)
+        self.allocated += len(node.children)
+        if self._size is not None:
+            self._size += len(node.children)
+
+    def share(self, node, other):
+        """Let leaf `node` continue with the children of `other`, which reached the same position."""
+        node.children = other.children
+        node.actions = other.actions
+        node.priors = other.priors
+
+    def backup(self, path, value):
+        for node in path:
+            node.N += 1.0
+            node.W += value
+            node.Q = node.W / node.N
+
+    def add_virtual_loss(self, path, loss):
+        """Count `loss` lost visits on `path`, so that other playouts avoid it while its evaluation
+        is pending. Adding `-loss` reverts it.
+        """
+        for node in path:
+            node.N += loss
+            node.W -= loss
+            node.Q = node.W / node.N if node.N else 0
+
+    def get_visits(self, full_size):
+        """Visit count of every root child, indexed by action."""
+        visits = np.zeros(full_size, np.float64)
+        for index, child in self.root.children.items():
+            visits[index] = child.N
+        return visits
+
+    def get_values(self, full_size):
+        """Total action value W of every root child, indexed by action."""
+        values = np.zeros(full_size, np.float64)
+        for index, child in self.root.children.items():
+            values[index] = child.W
+        return values
+
+    def update_one(self, index):
+        if self.root.children and index in self.root.children:
+            self.root = self.root.children[index]
+            self.root.release_parent()
+            self._size = None
+        else:
+            # a new node, the old root may be in a `TranspositionTable` under its position
+            self.root = MCTNode(None, 1.0)
+            self._size = 1
+
+    def back(self, num):
+        """Step the root `num` moves back if those ancestors are still kept, otherwise restart."""
+        node = self.root
+        for _ in range(num):
+            node = node.parent if node else None
+        self.root = node if node else MCTNode(None, 1.0)
+        self._size = None
+
+    def reset(self):
+        self.root.clear_to_root()
+        self._size = 1
+
+
+class ArrayTree(object):
+    """Tree backend keeping N, W, Q and P of all nodes in preallocated arrays indexed by node id.
+    The children of a node are stored contiguously from `child_start[node]` for `child_num[node]`
+    ids, so selection is a single vectorized argmax over that slice. Nodes are ids, the root is 0.
+    """
+    FIELDS = ('N', 'W', 'Q', 'P', 'action', 'parent', 'child_start', 'child_num')
+    lazy = False
+
+    def __init__(self, capacity=utils.MCTS_TREE_CAPACITY):
+        self.capacity = capacity
+        self.N = np.zeros(capacity, np.float64)             # visit time
+        self.W = np.zeros(capacity, np.float64)             # total action value
+        self.Q = np.zeros(capacity, np.float64)             # mean action value
+        self.P = np.zeros(capacity, np.float64)             # prior prob
+        self.action = np.zeros(capacity, np.intp)           # move leading to the node
+        self.parent = np.zeros(capacity, np.intp)
+        self.child_start = np.zeros(capacity, np.intp)
+        self.child_num = np.zeros(capacity, np.intp)
+        self.root = 0
+        self.size = 0
+        self.allocated = 0      # nodes created by expansions so far
+        self.max_capacity = None    # the arrays never grow beyond it, see `limit_capacity`
+        self.reset()
+
+    @property
+    def node_bytes(self):
+        return sum(getattr(self, field).itemsize for field in self.FIELDS)
+
+    @property
+    def memory(self):
+        """Bytes taken by the node arrays, which grow with the tree but are not shrunk."""
+        return sum(getattr(self, field).nbytes for field in self.FIELDS)
+
+    def resize(self, capacity):
+        self.capacity = capacity
+        for field in self.FIELDS:
+            array = getattr(self, field)
+            resized = np.zeros(capacity, array.dtype)
+            resized[:self.size] = array[:self.size]
+            setattr(self, field, resized)
+
+    def limit_capacity(self, node_limit):
+        """Keep the arrays within `node_limit` nodes, None for no limit, shrinking them now if the
+        tree fits. Growing doubles the capacity up to this limit only.
+        """
+        self.max_capacity = node_limit
+        if node_limit and self.size <= node_limit < self.capacity:
+            self.resize(node_limit)
+
+    def allocate(self, num):
+        """Take `num` fresh contiguous node ids, growing the arrays if needed."""
+        if self.size + num > self.capacity:
+            capacity = self.capacity
+            while self.size + num > capacity:
+                capacity *= 2
+            if self.max_capacity:
+                capacity = max(min(capacity, self.max_capacity), self.size + num)
+            self.resize(capacity)
+
+        start = self.size
+        self.size += num
+        for field in ('N', 'W', 'Q', 'child_start', 'child_num'):
+            getattr(self, field)[start:self.size] = 0
+        return start
+
+    def is_leaf(self, node):
+        return self.child_num[node] == 0
+
+    def select(self, node):
+        """Select the child with maximum Q + U, returning (action, child)."""
+        start = self.child_start[node]
+        end = start + self.child_num[node]
+        score = self.Q[start:end] + utils.C_PUCT * self.P[start:end] * (self.N[node] ** 0.5) / (1 + self.N[start:end])
+        child = start + score.argmax()
+        return self.action[child], child
+
+    def expand(self, node, predict):
+        actions = np.flatnonzero(predict > 0)
+        start = self.allocate(actions.size)
+        end = self.size
+        self.P[start:end] = predict[actions]
+        self.action[start:end] = actions
+        self.parent[start:end] = node
+        self.child_start[node] = start
+        self.child_num[node] = actions.size
+        self.allocated += actions.size
+
+    def backup(self, path, value):
+        self.N[path] += 1.0
+        self.W[path] += value
+        self.Q[path] = self.W[path] / self.N[path]
+
+    def add_virtual_loss(self, path, loss):
+        self.N[path] += loss
+        self.W[path] -= loss
+        N = self.N[path]
+        self.Q[path] = np.where(N > 0, self.W[path] / np.maximum(N, 1), 0)
+
+    def get_visits(self, full_size):
+        """Visit count of every root child, indexed by action."""
+        visits = np.zeros(full_size, np.float64)
+        start = self.child_start[self.root]
+        end = start + self.child_num[self.root]
+        visits[self.action[start:end]] = self.N[start:end]
+        return visits
+
+    def get_values(self, full_size):
+        """Total action value W of every root child, indexed by action."""
+        values = np.zeros(full_size, np.float64)
+        start = self.child_start[self.root]
+        end = start + self.child_num[self.root]
+        values[self.action[start:end]] = self.W[start:end]
+        return values
+
+    def update_one(self, index):
+        start = self.child_start[self.root]
+        found = np.flatnonzero(self.action[start:start + self.child_num[self.root]] == index)
+        if found.size:
+            self.rebase(start + found[0])
+        else:
+            self.reset()
+
+    def rebase(self, node):
+        """Make `node` the root and pack its subtree to the front of the arrays, level by level,
+        dropping every other node.
+        """
+        order = [np.array([node], np.intp)]
+        frontier = order[0]
+        while frontier.size:
+            num = self.child_num[frontier]
+            start = self.child_start[frontier][num > 0]
+            num = num[num > 0]
+            offset = np.cumsum(num) - num
+            frontier = np.repeat(start - offset, num) + np.arange(num.sum())
+            order.append(frontier)
+        order = np.concatenate(order)
+
+        new_id = np.zeros(self.size, np.intp)
+        new_id[order] = np.arange(order.size)
+        for field in ('N', 'W', 'Q', 'P', 'action', 'child_num'):
+            array = getattr(self, field)
+            array[:order.size] = array[order]
+        self.child_start[:order.size] = new_id[self.child_start[order]]
+        self.parent[:order.size] = new_id[self.parent[order]]
+        self.parent[0] = -1
+        self.root = 0
+        self.size = order.size
+
+    def prune(self, target):
+        """Drop the children of the least visited expanded nodes until at most `target` nodes
+        are left, then pack the tree. Their visit statistics are kept and they are expanded again
+        when selected.
+        """
+        while self.size > target:
+            expanded = np.flatnonzero(self.child_num[:self.size])
+            expanded = expanded[expanded != self.root]
+            if not expanded.size:
+                break
+            order = expanded[np.argsort(self.N[expanded], kind='stable')]
+            drop_num = np.searchsorted(np.cumsum(self.child_num[order]), self.size - target) + 1
+            self.child_num[order[:drop_num]] = 0
+            self.rebase(self.root)
+
+    def back(self, num):
+        """Ancestors are dropped by `rebase`, so stepping back always restarts."""
+        self.reset()
+
+    def reset(self):
+        self.size = 0
+        self.root = self.allocate(1)
+        self.P[self.root] = 1.0
+        self.parent[self.root] = -1
+
+
+TREES = {
+    'node': NodeTree,
+    'array': ArrayTree
+}
+
+class TranspositionTable(object):
+    """Expanded nodes by the zobrist key of their position. Beyond `capacity` entries the least
+    recently used one is dropped, its subtree stays in the tree but is no longer shared. Nodes are
+    held by weak references, so an entry whose subtree has been dropped from the tree goes with it
+    and the table survives moving the root.
+    """
+    def __init__(self, capacity=utils.MCTS_TRANSPOSITION_SIZE):
+        self.capacity = capacity
+        self.nodes = LRUCache(capacity)
+        self.entry_bytes = sys.getsizeof(2 ** 63) + sys.getsizeof(weakref.ref(self)) + measure_entry_bytes()
+
+    def get(self, key):
+        ref = self.nodes.get(key)
+        if ref is None:
+            return None
+        node = ref()
+        if node is None:
+            self.nodes.pop(key)
+        return node
+
+    def put(self, key, node):
+        self.nodes.put(key, weakref.ref(node))
+
+    def limit_memory(self, max_bytes):
+        """Keep the entries within about `max_bytes`, None for the `capacity` alone. The nodes
+        themselves are counted with the tree.
+        """
+        self.nodes.limit_memory(max_bytes, self.entry_bytes)
+
+    def clear(self):
+        self.nodes.clear()
+
+    def __len__(self):
+        return len(self.nodes)
+
+
+class SearchController(object):
+    """Decides when a search stops. It ends at `playout_num` playouts or after `time_limit` seconds,
+    whichever comes first, either may be None. With `early_stop` it also ends once the most visited
+    root child leads the second by more than the playouts left, estimated from the search speed when
+    timed. If the time runs out while the top two children are within `close_rate` of each other,
+    the deadline is extended once by `extend_rate` of the time limit.
+    """
+    def __init__(self, playout_num=None, time_limit=None, early_stop=utils.MCTS_EARLY_STOP,
+                 close_rate=utils.MCTS_CLOSE_RATE, extend_rate=utils.MCTS_TIME_EXTEND,
+                 check_interval=utils.MCTS_CHECK_INTERVAL):
+        self.playout_num = playout_num
+        self.time_limit = time_limit
+        self.early_stop = early_stop
+        self.close_rate = close_rate
+        self.extend_rate = extend_rate
+        self.check_interval = check_interval
+        self.start()
+
+    def start(self):
+        self.start_time = time()
+        self.deadline = None if self.time_limit is None else self.start_time + self.time_limit
+        self.extended = False
+        self.next_check = self.check_interval
+
+    def playout_left(self, playout_num):
+        """Playouts left in the playout budget after `playout_num` done."""
+        if self.playout_num is None:
+            return float('inf')
+        return self.playout_num - playout_num
+
+    def top_two(self, visits):
+        return np.partition(visits, -2)[:-3:-1]
+
+    def should_stop(self, get_visits, playout_num):
+        """Whether to stop after `playout_num` playouts, `get_visits` gives the root visit counts."""
+        left = self.playout_left(playout_num)
+        if left <= 0:
+            return True
+        if playout_num == 0:
+            return False
+
+        if self.deadline is not None:
+            now = time()
+            if now >= self.deadline:
+                first, second = self.top_two(get_visits())
+                if self.extended or second < self.close_rate * first:
+                    return True
+                self.deadline += self.extend_rate * self.time_limit
+                self.extended = True
+            left = min(left, (self.deadline - now) * playout_num / max(now - self.start_time, 1e-6))
+
+        if self.early_stop and playout_num >= self.next_check:
+            self.next_check = playout_num + self.check_interval
+            first, second = self.top_two(get_visits())
+            if first - second > left:
+                return True
+        return False
 
-    def is_leaf(self):
-        return self.children == {}
 
 class MCT(object):
     """A simple (and slow) single-threaded implementation of Monte Carlo Tree Search.
@@ -115,7 +566,9 @@ class MCT(object):
     fast evaluation from leaf nodes to the end of the game.
     """
 
-    def __init__(self, board, model_num=None):
+    def __init__(self, board, model_num=None, net=None, tree_type=utils.MCTS_TREE_TYPE,
+                 thread_num=utils.MCTS_THREAD_NUM, transposition=utils.MCTS_TRANSPOSITION,
+                 solver=utils.MCTS_SOLVER, lazy=utils.MCTS_LAZY_EXPAND, near_only=utils.MCTS_NEAR_ONLY):
         """Arguments:
         value_fn -- a function that takes in a state and ouputs a score in [-1, 1], i.e. the
             expected value of the end game score from the current player's perspective.
@@ -128,8 +581,19 @@ class MCT(object):
         c_puct -- a number in (0, inf) that controls how quickly exploration converges to the
             maximum-value policy, where a higher value means relying on the prior more, and
             should be used only in conjunction with a large value for n_playout.
+        net -- evaluator providing `get_predict_and_value`, a `Net` of `model_num` by default.
+        tree_type -- tree backend, 'node' for linked `MCTNode`s or 'array' for `ArrayTree`.
+        thread_num -- number of threads searching the tree together, see `play_threads`.
+        transposition -- share the subtree of a position reached by different move orders through
+            a `TranspositionTable`, only with the 'node' tree.
+        solver -- prove leaves won or lost by continuous fours with a `ThreatSolver` before
+            evaluating them, see `solve`.
+        lazy -- make children only when first selected, see `NodeTree`, only with the 'node' tree.
+        near_only -- only expand the cells near the stones, `Board.near_mask`, see `get_mask`.
         """
-        self.root = MCTNode(None, 1.0)
+        if lazy and tree_type != 'node':
+            raise ValueError('lazy expansion needs the node tree')
+        self.tree = NodeTree(lazy) if lazy else TREES[tree_type]()
         self.board = board
         self.max_evaluate_time = utils.MAX_MCTS_EVALUATE_TIME   # max evaluate time
         self.tau = utils.TAU_UP                                 # temperature para
@@ -137,7 +601,29 @@ class MCT(object):
                                                                 # round >= 30   : 0.01
         self.dirichlet_noise_distribute = dirichlet(np.ones(self.board.full_size) * 0.03)
         self.noise_rate = utils.NOISE_RATE
-        self.net = Net(model_num)
+        self.search_undo = utils.MCTS_SEARCH_UNDO              # descend on self.board and undo back,
+                                                                # instead of searching on a deepcopy
+        self.batch_size = utils.MCTS_BATCH_SIZE                 # leaves evaluated per net call
+        self.virtual_loss = utils.MCTS_VIRTUAL_LOSS
+        self.features = None                                    # batch input buffer
+        self.thread_num = thread_num
+        self.time_limit = utils.MCTS_TIME_LIMIT                 # seconds per search, None for no limit
+        self.max_nodes = utils.MCTS_MAX_NODES                   # node ceiling of the tree, None for no limit
+        self.max_memory = utils.MCTS_MAX_MEMORY                 # byte ceiling of the tree and caches,
+                                                                # None for no limit
+        self.ponder_limit = utils.MCTS_PONDER_LIMIT             # playouts per ponder, None for no limit
+        self.ponder_thread = None
+        self.ponder_event = None
+        self.ponder_num = 0
+        self.stats = None                                       # `SearchStats` of the last search
+        self.stats_sinks = [log_sink(Logger('search', handlers=['file']))] if utils.MCTS_STATS_LOG else []
+        if transposition and tree_type != 'node':
+            raise ValueError('transposition table needs the node tree')
+        self.transposition = TranspositionTable() if transposition else None
+        self.net = self.cache_net(Net(model_num) if net is None else net)
+        self.forbidden = ForbiddenDetector(self.board.size) if self.board.renju else None
+        self.solver = ThreatSolver(forbidden=self.forbidden) if solver else None
+        self.near_only = near_only
 
     def play(self):
         """Run a single playout from the root to the given depth, getting a value at the leaf and
@@ -149,50 +635,438 @@ class MCT(object):
         Returns:
         None
         """
+        ponder_playouts = self.stop_ponder()
+        self.ponder_num = 0
+        self.stats = SearchStats(self.board.round_num, self.get_visits().sum(), ponder_playouts)
+        allocated = self.tree.allocated
         evaluate_time = 0
-        actual_evaluate_time = 0
-        with timeit_context('search main'):
-            while evaluate_time < self.max_evaluate_time:
-                index, node = None, self.root
-                temp_board = deepcopy(self.board)
-                # go down to leaf node
-                while not node.is_leaf():
-                    index, node = node.select()
-                    temp_board.move(index)
-                    temp_board.round_change(1)
-                # leaf node
-                if index is not None and temp_board.judge_win(index):
-                    node.backup(1.0)
-                elif temp_board.judge_round_up():
-                    node.backup(0.0)
+        controller = SearchController(self.max_evaluate_time, self.time_limit)
+        if self.thread_num > 1:
+            self.play_threads(controller)
+        else:
+            while not controller.should_stop(self.get_visits, evaluate_time):
+                self.limit_tree()
+                if self.batch_size > 1:
+                    playout_num, _ = self.playout_batch(
+                        min(self.batch_size, controller.playout_left(evaluate_time))
+                        )
+                    evaluate_time += playout_num
+                    continue
+                if self.search_undo:
+                    root_move_num = len(self.board.move_history)
+                    try:
+                        self.playout(self.board)
+                    finally:
+                        self.rewind(self.board, root_move_num)
                 else:
-                    predict, value = self.evaluate(temp_board)
-                    node.expand(predict)
-                    node.backup(value)
-                    actual_evaluate_time += 1
+                    self.playout(deepcopy(self.board))
                 evaluate_time += 1
-            print(actual_evaluate_time)
 
-        del temp_board
-        utils.CLEAR()
+        self.stats.nodes = self.tree.allocated - allocated
+        self.stats.finish(self.tree.size)
+        self.emit_stats()
+
+    async def play_async(self):
+        """Awaitable `play`, blocking the event loop for the whole search, see `AsyncMCT`."""
+        self.play()
+
+    def emit_stats(self):
+        """Hand the record of the last search to every sink in `stats_sinks`."""
+        record = self.stats.to_dict()
+        for sink in self.stats_sinks:
+            sink(record)
+
+    @property
+    def root(self):
+        return self.tree.root
+
+    def rewind(self, board, move_num):
+        """Undo the moves played on `board` during a descent."""
+        while len(board.move_history) > move_num:
+            board.undo()
+
+    def descend(self, board):
+        """Go down from the root to a leaf, playing the selected moves on `board`.
+        Returns:
+        A tuple of (last move, nodes from the root to the leaf)
+        """
+        tree = self.tree
+        index, node = None, tree.root
+        path = [node]
+        while not tree.is_leaf(node):
+            index, node = tree.select(node)
+            board.move(index)
+            board.round_change(1)
+            path.append(node)
+        return index, path
+
+    def transpose(self, board, node):
+        """If the position of leaf `node` on `board` has been expanded elsewhere in the tree, share
+        that subtree with `node` and return its mean value, which is backed up in place of a network
+        evaluation. Returns None otherwise.
+        """
+        if self.transposition is None:
+            return None
+        other = self.transposition.get(board.zobrist_key)
+        if other is None or other is node or self.tree.is_leaf(other):
+            return None
+        self.tree.share(node, other)
+        self.stats.transpositions += 1
+        return other.Q
+
+    def solve(self, board):
+        """Exact value of the leaf position on `board` if the `ThreatSolver` proves it, or None.
+        A win by continuous fours for the side to move is a loss for the player who moved into the
+        leaf, the same sign as `judge_leaf`. Solved leaves are not expanded, so every visit backs
+        up the exact value again, found in the solver cache.
+        """
+        if self.solver is None:
+            return None
+        result = self.solver.solve(board)
+        if result == UNKNOWN:
+            return None
+        self.stats.solved += 1
+        return -float(result)
+
+    def settle(self, board, path):
+        """Value of the leaf ending `path` found without the network, by `solve` or `transpose`, or
+        None. The root is never solved, it has to be expanded to choose a move.
+        """
+        value = self.solve(board) if len(path) > 1 else None
+        if value is None:
+            value = self.transpose(board, path[-1])
+        return value
+
+    def judge_leaf(self, board, index):
+        """Value of a finished game at the leaf, or None if the game goes on."""
+        if index is not None and board.judge_win(index):
+            return 1.0
+        elif board.judge_round_up():
+            return 0.0
+        return None
+
+    def playout(self, board):
+        """Descend from the root to a leaf by playing moves on `board`, then evaluate and expand
+        the leaf and back the value up. `board` is left at the leaf position.
+        Returns:
+        1 if the network was evaluated, else 0
+        """
+        stats = self.stats
+        stats.lap()
+        index, path = self.descend(board)
+        stats.playouts += 1
+        stats.add_depth(len(path) - 1)
+        value = self.judge_leaf(board, index)
+        if value is not None:
+            stats.terminals += 1
+        else:
+            value = self.settle(board, path)
+        stats.lap('select')
+        if value is None:
+            predict, value = self.evaluate(board)
+            stats.evaluations += 1
+            stats.lap('evaluate')
+            self.tree.expand(path[-1], predict)
+            self.tree.backup(path, value)
+            self.remember(board.zobrist_key, path[-1])
+            stats.lap('backup')
+            return 1
+        self.tree.backup(path, value)
+        stats.lap('backup')
+        return 0
+
+    def playout_batch(self, num):
+        """Collect up to `num` leaves on `self.board`, putting a virtual loss on each path so the
+        next descent tends to take another one, then evaluate all of them in a single net call and
+        expand and back them up. Collecting stops early if a pending leaf is selected again.
+        Returns:
+        A tuple of (playouts, network evaluations)
+        """
+        if self.features is None or len(self.features) < num:
+            self.features = np.zeros((num,) + self.board.get_feature(self.board.now_color).shape[1:], np.float32)
+
+        stats = self.stats
+        stats.lap()
+        root_move_num = len(self.board.move_history)
+        paths, keys, masks, noises = [], [], [], []
+        playout_num = 0
+        try:
+            while playout_num < num:
+                index, path = self.descend(self.board)
+                value = self.judge_leaf(self.board, index)
+                if value is None and any(path[-1] == other[-1] for other in paths):
+                    break
+                stats.playouts += 1
+                stats.add_depth(len(path) - 1)
+                if value is not None:
+                    stats.terminals += 1
+                else:
+                    value = self.settle(self.board, path)
+                if value is not None:
+                    self.tree.backup(path, value)
+                else:
+                    self.features[len(paths)] = self.board.get_feature(self.board.now_color)[0]
+                    keys.append(self.board.zobrist_key)
+                    masks.append(self.get_mask(self.board))
+                    noises.append(self.board.round_num == 0)
+                    paths.append(path)
+                    self.tree.add_virtual_loss(path, self.virtual_loss)
+                playout_num += 1
+                self.rewind(self.board, root_move_num)
+        finally:
+            self.rewind(self.board, root_move_num)
+        stats.lap('select')
+
+        if paths:
+            predicts, values = self.net.get_predicts_and_values(self.features[:len(paths)])
+            stats.evaluations += len(paths)
+            stats.lap('evaluate')
+            for path, key, predict, value, mask, noise in zip(paths, keys, predicts, values, masks, noises):
+                self.tree.add_virtual_loss(path, -self.virtual_loss)
+                self.tree.expand(path[-1], self.normalize(predict, mask, noise))
+                self.tree.backup(path, value)
+                self.remember(key, path[-1])
+            stats.lap('backup')
+        return playout_num, len(paths)
+
+    def play_threads(self, controller):
+        """Run the playouts in `thread_num` threads sharing this tree. Every thread descends on its
+        own copy of the board. The tree lock is held while selecting and while expanding and
+        backing up, and released while the thread waits for the shared `BatchEvaluator`, with a
+        virtual loss on its path so the others go elsewhere. A thread reaching a leaf that another
+        one is evaluating waits for that expansion. Stage times in `self.stats` are summed over the
+        threads.
+        Returns:
+        A tuple of (playouts, network evaluations)
+        """
+        tree = self.tree
+        stats = self.stats
+        evaluator = BatchEvaluator(self.net, self.thread_num)
+        condition = threading.Condition()
+        pending = set()
+        count = [0, 0]
+        stopped = [False]
+        errors = []
+
+        def worker(board):
+            root_move_num = len(board.move_history)
+            try:
+                while True:
+                    with condition:
+                        if stopped[0] or controller.should_stop(self.get_visits, count[0]):
+                            stopped[0] = True
+                            return
+                        if self.is_tree_full():
+                            # prune only once no evaluation is pending, node ids may change
+                            if pending:
+                                condition.wait()
+                                continue
+                            self.limit_tree()
+                        start_time = time()
+                        index, path = self.descend(board)
+                        node = path[-1]
+                        value = self.judge_leaf(board, index)
+                        if value is None and node in pending:
+                            self.rewind(board, root_move_num)
+                            condition.wait()
+                            continue
+                        count[0] += 1
+                        stats.playouts += 1
+                        stats.add_depth(len(path) - 1)
+                        if value is not None:
+                            stats.terminals += 1
+                        else:
+                            value = self.settle(board, path)
+                        if value is not None:
+                            tree.backup(path, value)
+                            self.rewind(board, root_move_num)
+                            stats.select_time += time() - start_time
+                            continue
+
+                        feature = board.get_feature(board.now_color)[0].copy()
+                        key, mask, noise = board.zobrist_key, self.get_mask(board), board.round_num == 0
+                        tree.add_virtual_loss(path, self.virtual_loss)
+                        pending.add(node)
+                        self.rewind(board, root_move_num)
+                        stats.select_time += time() - start_time
+
+                    start_time = time()
+                    try:
+                        predict, value = evaluator.evaluate(feature)
+                    except Exception:
+                        with condition:
+                            tree.add_virtual_loss(path, -self.virtual_loss)
+                            pending.discard(node)
+                            condition.notify_all()
+                        raise
+
+                    with condition:
+                        stats.evaluate_time += time() - start_time
+                        start_time = time()
+                        tree.add_virtual_loss(path, -self.virtual_loss)
+                        tree.expand(node, self.normalize(predict, mask, noise))
+                        tree.backup(path, value)
+                        self.remember(key, node)
+                        pending.discard(node)
+                        count[1] += 1
+                        stats.evaluations += 1
+                        stats.backup_time += time() - start_time
+                        condition.notify_all()
+            except Exception as error:
+                errors.append(error)
+                with condition:
+                    stopped[0] = True
+                    condition.notify_all()
+
+        threads = [
+            threading.Thread(target=worker, args=(deepcopy(self.board),))
+            for _ in range(self.thread_num)
+            ]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            evaluator.close()
+
+        if errors:
+            raise errors[0]
+        return count[0], count[1]
+
+    def get_node_limit(self):
+        """The node ceiling given by `max_nodes` and the part of `max_memory` left to the tree,
+        None if neither is set.
+        """
+        limits = []
+        if self.max_nodes:
+            limits.append(self.max_nodes)
+        if self.max_memory:
+            limits.append((self.max_memory - self.get_cache_memory()) // self.tree.node_bytes)
+        return min(limits) if limits else None
+
+    def get_caches(self):
+        """The caches kept besides the tree, each bounded by its `limit_memory`."""
+        caches = [cache for cache in (self.transposition, self.forbidden, self.solver) if cache is not None]
+        if isinstance(self.net, CachedNet):
+            caches.append(self.net)
+        return caches
+
+    def get_cache_memory(self):
+        """Bytes of `max_memory` given to the caches, `utils.MCTS_CACHE_MEMORY_RATE` of it if any."""
+        if not self.max_memory or not self.get_caches():
+            return 0
+        return int(self.max_memory * utils.MCTS_CACHE_MEMORY_RATE)
+
+    def limit_caches(self):
+        """Share the cache part of `max_memory` evenly between the caches."""
+        caches = self.get_caches()
+        for cache in caches:
+            cache.limit_memory(self.get_cache_memory() // len(caches) if self.max_memory else None)
+
+    def ponder(self):
+        """Keep running playouts from the current root in a background thread, on the opponent's
+        time, until `stop_ponder`. The thread searches a copy of the board, which must be at the
+        root position now. Any later call changing the tree stops it first, so the visits gathered
+        are kept when `update_one` promotes the opponent's move.
+        """
+        self.stop_ponder()
+        self.stats = SearchStats(self.board.round_num, self.get_visits().sum())
+        self.ponder_event = threading.Event()
+        self.ponder_thread = threading.Thread(
+            target=self.ponder_loop, args=(deepcopy(self.board), self.ponder_event)
+            )
+        self.ponder_thread.daemon = True
+        self.ponder_thread.start()
+
+    def ponder_loop(self, board, event):
+        root_move_num = len(board.move_history)
+        start_num = self.ponder_num
+        while not event.is_set() and (self.ponder_limit is None or self.ponder_num - start_num < self.ponder_limit):
+            self.limit_tree()
+            try:
+                self.playout(board)
+            finally:
+                self.rewind(board, root_move_num)
+            self.ponder_num += 1
+
+    def stop_ponder(self):
+        """Stop pondering if running. Returns the playouts pondered since the last search, which
+        are kept after the thread stops until `play` takes them.
+        """
+        if self.ponder_thread is not None:
+            self.ponder_event.set()
+            self.ponder_thread.join()
+            self.ponder_thread = None
+        return self.ponder_num
+
+    def ponder_from(self, moves):
+        """Bring the board to the position after `moves` and ponder, used by `RootParallelMCT`."""
+        self.stop_ponder()
+        sync_board(self.board, moves)
+        self.ponder()
+
+    def is_tree_full(self):
+        """Whether the expansions of the next batch or of every thread might cross the node ceiling.
+        A lazy expansion makes a single node per playout.
+        """
+        limit = self.get_node_limit()
+        expansion_num = max(self.batch_size, self.thread_num)
+        growth = 1 if self.tree.lazy else self.board.full_size
+        return bool(limit) and self.tree.size + expansion_num * growth > limit
+
+    def limit_tree(self):
+        """Prune the tree to `utils.MCTS_PRUNE_RATE` of the node ceiling when it is full, and keep
+        the caches within their part of `max_memory`.
+        """
+        self.limit_caches()
+        self.tree.limit_capacity(self.get_node_limit())
+        if self.is_tree_full():
+            self.tree.prune(int(self.get_node_limit() * utils.MCTS_PRUNE_RATE))
+
+    def get_tree_size(self):
+        return self.tree.size
+
+    def get_tree_memory(self):
+        return self.tree.memory
+
+    def remember(self, key, node):
+        """Record the expanded `node` as the tree's node for the position of zobrist `key`."""
+        if self.transposition is not None:
+            self.transposition.put(key, node)
 
     def evaluate(self, board):
-        """Use the rollout policy to play until the end of the game, returning +1 if the current
-        player wins, -1 if the opponent wins, and 0 if it is a tie.
+        """Evaluate the position with the network, returning the normalized prior over legal moves
+        and the value.
         """
-        # net work evaluate + Dirichlet noise
         predict, value = self.net.get_predict_and_value(board.get_feature(board.now_color))
-        if board.round_num is 0:
+        return self.normalize(predict, self.get_mask(board), board.round_num == 0), value
+
+    def get_mask(self, board):
+        """Cells the side to move may play, only those near the stones with `near_only` unless
+        none of them is allowed.
+        """
+        mask = board.legal_mask.copy()
+        if self.forbidden is not None and board.now_color == utils.BLACK:
+            mask &= ~self.forbidden.get_mask(board)
+        if self.near_only:
+            near = mask & board.near_mask
+            if near.any():
+                mask = near
+        return mask
+
+    def normalize(self, predict, mask, noise=False):
+        """Add Dirichlet noise if asked, keep only the cells in `mask` and normalize."""
+        if noise:
             noise = self.dirichlet_noise_distribute.rvs()[0]
             predict = (1 - self.noise_rate) * predict + self.noise_rate * noise
 
-        predict[board.board != 0] = 0
-
+        predict = predict * mask
         if predict.sum() <= 0:
-            predict[board.empty_pos] = np.random.sample(board.full_size)[board.empty_pos]
+            predict = np.random.sample(mask.size) * mask
 
         predict = predict / predict.sum()
-        return predict, value
+        return predict
 
     def get_move_probability(self):
         """Runs all playouts sequentially and returns the most visited action.
@@ -205,26 +1079,24 @@ class MCT(object):
             self.tau = utils.TAU_LOW
 
         temperature_para = 1 / self.tau
-        move_probability = np.array(
-            [
-                self.root.children[i].N ** temperature_para if i in self.root.children else 0
-                for i in range(self.board.full_size)
-            ],
-            np.float64
-            )
+        visits = self.get_visits()
+        with np.errstate(over='ignore'):
+            move_probability = visits ** temperature_para
 
-        while move_probability.sum() == np.inf or move_probability.sum() < 0:
-            temperature_para /= 2.0
-            move_probability = np.array(
-                [
-                    self.root.children[i].N ** temperature_para if i in self.root.children else 0
-                    for i in range(self.board.full_size)
-                ],
-                np.float64
-                )
+            while move_probability.sum() == np.inf or move_probability.sum() < 0:
+                temperature_para /= 2.0
+                move_probability = visits ** temperature_para
 
         return (move_probability / move_probability.sum()).astype(np.float32)
 
+    def get_visits(self):
+        """Visit count of every root child, indexed by action."""
+        return self.tree.get_visits(self.board.full_size)
+
+    def get_values(self):
+        """Total action value W of every root child, indexed by action."""
+        return self.tree.get_values(self.board.full_size)
+
     def update(self, index, oppo_index):
         """Step forward in the tree, keeping everything we already know about the subtree, assuming
         that get_move() has been called already. Siblings of the new root will be garbage-collected.
@@ -234,22 +1106,259 @@ class MCT(object):
         self.update_one(oppo_index)
 
     def update_one(self, index):
-        if self.root.children and index in self.root.children:
-            self.root = self.root.children[index]
-            self.root.release_parent()
-        else:
-            self.root.clear_to_root()
+        self.stop_ponder()
+        self.tree.update_one(index)
 
     def get_move(self, probability):
         index = np.random.choice(np.arange(self.board.full_size), p=probability)
         return index
 
+    def back(self, num):
+        self.stop_ponder()
+        self.tree.back(num)
+
     def reset(self):
-        self.root.clear_to_root()
+        self.stop_ponder()
+        self.ponder_num = 0
+        self.tree.reset()
+        if self.transposition is not None:
+            self.transposition.clear()
         self.tau = 1
 
     def reset_net(self, model_num):
-        self.net = Net(model_num)
+        self.net = self.cache_net(Net(model_num))
+
+    def cache_net(self, net):
+        """Put a `CachedNet` in front of `net` if `utils.MCTS_EVAL_CACHE` is set."""
+        return CachedNet(net) if utils.MCTS_EVAL_CACHE else net
+
+    def get_model_num(self):
+        return self.net.get_model_num()
+
+    def search(self, moves, playout_num, time_limit=None, max_nodes=None, max_memory=None):
+        """Bring the board to the position after `moves`, search for `playout_num` playouts or
+        `time_limit` seconds within the given tree ceilings and return the root statistics, used by
+        the worker processes of `RootParallelMCT`.
+        Returns:
+        A tuple of (visits, total values) of the root children, indexed by action, and the record
+        of the search.
+        """
+        sync_board(self.board, moves)
+        self.max_evaluate_time = playout_num
+        self.time_limit = time_limit
+        self.max_nodes = max_nodes
+        self.max_memory = max_memory
+        self.play()
+        return self.get_visits(), self.get_values(), self.stats.to_dict()
+
+
+def sync_board(board, moves):
+    """Undo `board` back to its common prefix with `moves`, then play the rest of `moves`."""
+    history = board.move_history
+    common = 0
+    while common < min(len(history), len(moves)) and history[common] == moves[common]:
+        common += 1
+    while len(history) > common:
+        board.undo()
+    for index in moves[common:]:
+        board.move(index)
+        if not (board.judge_win(index) or board.judge_round_up()):
+            board.round_change(1)
+
+
+def search_worker(connection, board, model_num, net, tree_type, seed):
+    """Main loop of a `RootParallelMCT` worker process. The worker owns an `MCT` on its own copy of
+    the board, so its net is loaded once and its tree is kept between moves, and runs the
+    `(method, args)` commands it receives, replying `(result, error)`.
+    """
+    np.random.seed(seed)
+    mct = MCT(board, model_num, net, tree_type)
+    mct.stats_sinks = []        # the parent reports the merged record
+    while True:
+        command = connection.recv()
+        if command is None:
+            break
+        method, args = command
+        try:
+            connection.send((getattr(mct, method)(*args), None))
+        except Exception as error:
+            connection.send((None, error))
+    connection.close()
+
+
+class RootParallelMCT(MCT):
+    """Root-parallel search. `process_num` worker processes are forked from the board, each growing
+    an independent tree with its own random state, so its own Dirichlet noise at the root. After a
+    search the visit counts and total values of the root children are summed over the workers, and
+    the move probability is taken from the merged visits. Tree updates are forwarded to every worker,
+    which keeps its tree between moves, so `update` behaves as in `MCT`. Workers are started with
+    `utils.MCTS_PROCESS_START`, which should be 'spawn' if a TensorFlow session already exists in
+    this process.
+    """
+    def __init__(self, board, model_num=None, net=None, tree_type=utils.MCTS_TREE_TYPE,
+                 process_num=utils.MCTS_PROCESS_NUM):
+        """Arguments:
+        board -- the game board, followed by the workers on every search.
+        model_num, net, tree_type -- as in `MCT`, used by every worker. The net is loaded in the
+            workers, not in this process.
+        process_num -- number of worker processes.
+        """
+        self.board = board
+        self.max_evaluate_time = utils.MAX_MCTS_EVALUATE_TIME
+        self.time_limit = utils.MCTS_TIME_LIMIT
+        self.max_nodes = utils.MCTS_MAX_NODES
+        self.max_memory = utils.MCTS_MAX_MEMORY
+        self.tau = utils.TAU_UP
+        self.visits = np.zeros(board.full_size, np.float64)
+        self.values = np.zeros(board.full_size, np.float64)
+        self.stats = None
+        self.stats_sinks = [log_sink(Logger('search', handlers=['file']))] if utils.MCTS_STATS_LOG else []
+        context = multiprocessing.get_context(utils.MCTS_PROCESS_START)
+        self.connections = []
+        self.processes = []
+        for seed in np.random.randint(2 ** 31, size=process_num):
+            connection, child_connection = context.Pipe()
+            process = context.Process(
+                target=search_worker,
+                args=(child_connection, board, model_num, net, tree_type, seed)
+                )
+            process.daemon = True
+            process.start()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+    def call(self, method, *args):
+        """Run `method` of every worker's `MCT` and return their results."""
+        for connection in self.connections:
+            connection.send((method, args))
+        results, errors = zip(*[connection.recv() for connection in self.connections])
+        for error in errors:
+            if error is not None:
+                raise error
+        return results
+
+    def play(self):
+        process_num = len(self.processes)
+        playout_num = self.max_evaluate_time and -(-self.max_evaluate_time // process_num)
+        max_nodes = self.max_nodes and self.max_nodes // process_num
+        max_memory = self.max_memory and self.max_memory // process_num
+        self.stats = SearchStats(self.board.round_num)
+        results = self.call(
+            'search', list(self.board.move_history), playout_num, self.time_limit, max_nodes, max_memory
+            )
+        self.visits = np.sum([visits for visits, _, _ in results], axis=0)
+        self.values = np.sum([values for _, values, _ in results], axis=0)
+        for _, _, record in results:
+            self.stats.merge(record)
+        self.stats.finish(self.stats.tree_size)
+        self.emit_stats()
+
+    def get_visits(self):
+        return self.visits
+
+    def get_values(self):
+        return self.values
+
+    def ponder(self):
+        self.call('ponder_from', list(self.board.move_history))
+
+    def stop_ponder(self):
+        return sum(self.call('stop_ponder'))
+
+    def get_tree_size(self):
+        return sum(self.call('get_tree_size'))
+
+    def get_tree_memory(self):
+        return sum(self.call('get_tree_memory'))
+
+    def update_one(self, index):
+        self.call('update_one', index)
+
+    def back(self, num):
+        self.call('back', num)
+
+    def reset(self):
+        self.call('reset')
+        self.tau = 1
+
+    def reset_net(self, model_num):
+        self.call('reset_net', model_num)
+
+    def get_model_num(self):
+        return self.call('get_model_num')[0]
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(None)
+        for process in self.processes:
+            process.join()
+        self.connections = []
+        self.processes = []
+
+
+class AsyncMCT(MCT):
+    """MCT searching as a coroutine, `play_async`, with its leaves evaluated by an `AsyncEvaluator`
+    shared with other searches. Any number of them can run concurrently on one event loop, each on
+    its own board, and all their pending leaves go to the net in the same batch. `play` runs one
+    search to the end on an event loop of its own. Stage times are not recorded, they would count
+    the time spent in the other searches.
+    """
+    def __init__(self, board, evaluator=None, model_num=None, net=None, **kwargs):
+        if evaluator is None:
+            evaluator = AsyncEvaluator(Net(model_num) if net is None else net)
+        super(AsyncMCT, self).__init__(board, net=evaluator.net, **kwargs)
+        self.net = evaluator.net        # cached by the evaluator if at all, shared with the others
+        self.evaluator = evaluator
+
+    def play(self):
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self.play_async())
+        finally:
+            loop.close()
+
+    async def play_async(self):
+        ponder_playouts = self.stop_ponder()
+        self.ponder_num = 0
+        self.stats = SearchStats(self.board.round_num, self.get_visits().sum(), ponder_playouts)
+        allocated = self.tree.allocated
+        playout_num = 0
+        controller = SearchController(self.max_evaluate_time, self.time_limit)
+        while not controller.should_stop(self.get_visits, playout_num):
+            self.limit_tree()
+            root_move_num = len(self.board.move_history)
+            try:
+                await self.playout_async(self.board)
+            finally:
+                self.rewind(self.board, root_move_num)
+            playout_num += 1
+
+        self.stats.nodes = self.tree.allocated - allocated
+        self.stats.finish(self.tree.size)
+        self.emit_stats()
+
+    async def playout_async(self, board):
+        """`playout` awaiting the evaluator. The board stays at the leaf while the search is
+        suspended, so it must not be shared with another running search.
+        """
+        stats = self.stats
+        index, path = self.descend(board)
+        stats.playouts += 1
+        stats.add_depth(len(path) - 1)
+        value = self.judge_leaf(board, index)
+        if value is not None:
+            stats.terminals += 1
+        else:
+            value = self.settle(board, path)
+        if value is None:
+            feature = board.get_feature(board.now_color)[0].copy()
+            key, mask, noise = board.zobrist_key, self.get_mask(board), board.round_num == 0
+            predict, value = await self.evaluator.evaluate(feature)
+            stats.evaluations += 1
+            self.tree.expand(path[-1], self.normalize(predict, mask, noise))
+            self.remember(key, path[-1])
+        self.tree.backup(path, value)
+
 
 def main():
     board = Board()
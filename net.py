@@ -10,6 +10,40 @@ from utils.tfrecord import generate_dataset
 from functools import wraps
 
 
+def generate_matrix_trans():
+    '''棋盘的8种对称变换`rot`及其逆变换`rot_inverse`, 以变换序号为键'''
+    rotat_0 = lambda m, axes=(0, 1): m
+    rotat_90 = lambda m, axes=(0, 1): np.rot90(m, 1, axes=axes)
+    rotat_180 = lambda m, axes=(0, 1): np.rot90(m, 2, axes=axes)
+    rotat_270 = lambda m, axes=(0, 1): np.rot90(m, 3, axes=axes)
+    reflect_0 = lambda m, axes=(0, 1): np.flip(m, axis=axes[1])
+    reflect_90 = lambda m, axes=(0, 1): np.flip(rotat_90(m, axes=axes), axis=axes[1])
+    reflect_180 = lambda m, axes=(0, 1): np.flip(rotat_180(m, axes=axes), axis=axes[1])
+    reflect_270 = lambda m, axes=(0, 1): np.flip(rotat_270(m, axes=axes), axis=axes[1])
+
+    rot = {
+        0: rotat_0,
+        1: rotat_90,
+        2: rotat_180,
+        3: rotat_270,
+        4: reflect_0,
+        5: reflect_90,
+        6: reflect_180,
+        7: reflect_270
+    }
+    rot_inverse = {
+        0: rotat_0,
+        1: rotat_270,
+        2: rotat_180,
+        3: rotat_90,
+        4: reflect_0,
+        5: reflect_90,
+        6: reflect_180,
+        7: reflect_270
+    }
+    return rot, rot_inverse
+
+
 def no_same_net(NET):
     @wraps(NET)
     def _no_same_net(model_num=-1):
@@ -55,36 +89,7 @@ class Net(object):
             self.load_model(model_num)
 
     def generate_matrix_trans(self):
-        rotat_0 = lambda m, axes=(0, 1): m
-        rotat_90 = lambda m, axes=(0, 1): np.rot90(m, 1, axes=axes)
-        rotat_180 = lambda m, axes=(0, 1): np.rot90(m, 2, axes=axes)
-        rotat_270 = lambda m, axes=(0, 1): np.rot90(m, 3, axes=axes)
-        reflect_0 = lambda m, axes=(0, 1): np.flip(m, axis=axes[1])
-        reflect_90 = lambda m, axes=(0, 1): np.flip(rotat_90(m, axes=axes), axis=axes[1])
-        reflect_180 = lambda m, axes=(0, 1): np.flip(rotat_180(m, axes=axes), axis=axes[1])
-        reflect_270 = lambda m, axes=(0, 1): np.flip(rotat_270(m, axes=axes), axis=axes[1])
-
-        rot = {
-            0: rotat_0,
-            1: rotat_90,
-            2: rotat_180,
-            3: rotat_270,
-            4: reflect_0,
-            5: reflect_90,
-            6: reflect_180,
-            7: reflect_270
-        }
-        rot_inverse = {
-            0: rotat_0,
-            1: rotat_270,
-            2: rotat_180,
-            3: rotat_90,
-            4: reflect_0,
-            5: reflect_90,
-            6: reflect_180,
-            7: reflect_270
-        }
-        return rot, rot_inverse
+        return generate_matrix_trans()
 
     def add_ph(self, net):
         ph = tl.layers.conv.conv_2d(
@@ -197,7 +202,7 @@ class Net(object):
     def get_predict_and_value(self, feature):
         predict, value = self.sess.run(
             [self.predict, self.value],
-            feed_dict={self.feature: feature.astype(np.float32)}
+            feed_dict={self.feature: np.asarray(feature, np.float32)}
             )
         return predict[0], value[0, 0]
         # else:
@@ -213,6 +218,14 @@ class Net(object):
         #     value = value[0, 0]
         #     return predict, value
 
+    def get_predicts_and_values(self, features):
+        '''一次`sess.run`评估一批特征, 返回`(batch, SIZE ** 2)`的策略与`(batch,)`的估值'''
+        predicts, values = self.sess.run(
+            [self.predict, self.value],
+            feed_dict={self.feature: np.asarray(features, np.float32)}
+            )
+        return predicts, values[:, 0]
+
     def train(self, files, batch_size=utils.BATCH_SIZE, write_summary=True):
         with self.graph.as_default():
             if self.summary is None:
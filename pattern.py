@@ -0,0 +1,135 @@
+# -*- coding:utf-8 -*-
+'''棋形识别: 五连, 活四, 冲四, 活三'''
+from __future__ import division
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import numpy as np
+import utils
+
+# 棋形, 数值越大越强
+NONE, OPEN_THREE, FOUR, OPEN_FOUR, FIVE = range(5)
+PATTERN_NAME = {
+    NONE: 'None',
+    OPEN_THREE: 'Open three',
+    FOUR: 'Four',
+    OPEN_FOUR: 'Open four',
+    FIVE: 'Five'
+}
+
+
+def window_sum(mask, width):
+    '''沿最后一维计算宽为`width`的滑动窗口内`mask`的个数'''
+    cum = np.zeros(mask.shape[:-1] + (mask.shape[-1] + 1,), np.int8)
+    np.cumsum(mask, axis=-1, dtype=np.int8, out=cum[..., 1:])
+    return cum[..., width:] - cum[..., :-width]
+
+
+def scan_pattern(own, empty):
+    '''逐一判断线段中心有己方棋子时, 沿该线段形成的棋形
+
+    `own`, `empty`为形如`(..., 2 * WIN_NUM - 1)`的布尔数组, 分别标出己方棋子和空位.
+    四以能成五的空位个数区分, 两个及以上为活四; 三以能否再走一步成两端皆空的四区分.
+    '''
+    win_num = utils.WIN_NUM
+
+    # 含中心的`WIN_NUM`格窗口
+    own_sum = window_sum(own, win_num)
+    five = (own_sum == win_num).any(axis=-1)
+    win_window = (own_sum == win_num - 1) & (window_sum(empty, win_num) == 1)
+    win_cell = np.zeros_like(empty)
+    for start in range(win_window.shape[-1]):
+        win_cell[..., start:start + win_num] |= win_window[..., start:start + 1] & empty[..., start:start + win_num]
+    win_cell_num = win_cell.sum(axis=-1)
+
+    # 中间`WIN_NUM - 1`格含中心, 两端皆空的窗口, 中间差一子即为活四
+    inner_own = window_sum(own, win_num - 1)[..., 1:-1]
+    inner_empty = window_sum(empty, win_num - 1)[..., 1:-1]
+    open_three = (
+        (inner_own == win_num - 2) & (inner_empty == 1) & empty[..., :win_num - 1] & empty[..., win_num:]
+        ).any(axis=-1)
+
+    pattern = np.full(own.shape[:-1], NONE, np.int8)
+    pattern[open_three] = OPEN_THREE
+    pattern[win_cell_num == 1] = FOUR
+    pattern[win_cell_num > 1] = OPEN_FOUR
+    pattern[five] = FIVE
+    return pattern
+
+
+PATTERN_TABLES = {}
+# 以`color`视角, 棋盘值`(WHITE, EMPTY, BLACK, WALL)`对应的状态: 0 空, 1 己方, 2 对方或棋盘外
+CELL_STATE = {
+    utils.BLACK: np.array([2, 0, 1, 2], np.intp),
+    utils.WHITE: np.array([1, 0, 2, 2], np.intp)
+}
+
+def get_pattern_table(length=2 * utils.WIN_NUM - 1):
+    '''获取长为`length`的线段的棋形表, 只在第一次调用时用`scan_pattern`枚举生成
+
+    返回`(table, weight)`, 线段各格状态与`weight`的点积即为其在`table`中的序号, 中心格权重为0.
+    '''
+    if length not in PATTERN_TABLES:
+        center = length // 2
+        power = 3 ** np.arange(length - 1)
+        weight = np.insert(power, center, 0)
+        state = np.insert(np.arange(power[-1] * 3)[:, np.newaxis] // power % 3, center, 1, axis=1)
+        table = scan_pattern(state == 1, state == 0)
+        table.setflags(write=False)
+        PATTERN_TABLES[length] = (table, weight)
+    return PATTERN_TABLES[length]
+
+
+def classify(segments, color):
+    '''判断`color`在线段中心落子(或已有棋子)后, 沿该线段形成的棋形
+
+    `segments`形如`(..., 2 * WIN_NUM - 1)`, 由`Board.get_segments`得到, 中心为对方棋子时记为`NONE`.
+    '''
+    table, weight = get_pattern_table(segments.shape[-1])
+    state = CELL_STATE[color][segments + 1]
+    blocked = segments[..., segments.shape[-1] // 2] == -color
+    return np.where(blocked, NONE, table[state.dot(weight)]).astype(np.int8)
+
+
+class PatternTable(object):
+    '''记录双方在每格每方向上的棋形
+
+    `patterns[color][index, direction]`为`color`在`index`处(空位则假设在此落子)沿
+    `board.DIRECTIONS[direction]`形成的棋形. 棋盘变化后调用`update`增量更新.
+    '''
+    def __init__(self, board):
+        self.board = board
+        self.patterns = {}
+        self.refresh()
+
+    def refresh(self):
+        '''对整个棋盘一次性重新识别'''
+        segments = self.board.get_segments()
+        for color in (utils.BLACK, utils.WHITE):
+            self.patterns[color] = classify(segments, color)
+
+    def update(self, index):
+        '''`index`处落子或撤销后, 只重新识别经过`index`的四条线上的格'''
+        table = self.board.segment_table[index]
+        inside = table < self.board.full_size
+        cells = table[inside]
+        directions = np.nonzero(inside)[0]
+        padded = np.append(self.board.board, np.int8(utils.WALL))
+        segments = padded[self.board.segment_table[cells, directions]]
+        for color in (utils.BLACK, utils.WHITE):
+            self.patterns[color][cells, directions] = classify(segments, color)
+
+    def best(self, color):
+        '''`color`在每格四个方向中最强的棋形'''
+        return self.patterns[color].max(axis=1)
+
+    def count(self, color, pattern):
+        '''`color`在每格达到`pattern`的方向数'''
+        return (self.patterns[color] == pattern).sum(axis=1)
+
+    def find(self, color, pattern, empty_only=True):
+        '''`color`在哪些格(默认只看空位)有方向形成`pattern`'''
+        found = (self.patterns[color] == pattern).any(axis=1)
+        if empty_only:
+            found &= self.board.legal_mask
+        return np.nonzero(found)[0]
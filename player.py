@@ -10,7 +10,7 @@ import utils
 from utils.tfrecord import generate_example, generate_writer
 from utils.logger import Logger
 from functools import partial
-from mcts import MCT, MCTNode
+from mcts import MCT, RootParallelMCT, AsyncMCT
 # from net import write_db
 
 class Player(object):
@@ -46,6 +46,10 @@ class Player(object):
     def reset(self):
         pass
 
+    async def get_move_async(self):
+        '''在事件循环中取得落子, 默认直接调用`get_move`'''
+        return self.get_move()
+
     def get_model_num(self):
         raise NotImplementedError()
 
@@ -75,11 +79,18 @@ class RandomPlayer(Player):
 
 
 class MCTSPlayer(Player):
-    def __init__(self, color, game, model_num):
+    def __init__(self, color, game, model_num, thread_num=utils.MCTS_THREAD_NUM,
+                 process_num=utils.MCTS_PROCESS_NUM):
         super(MCTSPlayer, self).__init__(color, utils.MCTS, game)
         self.prob_history = list()
         self.probability = None
-        self.mct = MCT(self.game.board, model_num)
+        self.tree_move_num = 0          # moves of `game.history` already applied to the tree
+        if game.evaluator is not None:
+            self.mct = AsyncMCT(self.game.board, game.evaluator)
+        elif process_num > 1:
+            self.mct = RootParallelMCT(self.game.board, model_num, process_num=process_num)
+        else:
+            self.mct = MCT(self.game.board, model_num, thread_num=thread_num)
 
     def add_history(self):
         if self.probability is not None:
@@ -87,14 +98,23 @@ class MCTSPlayer(Player):
         else:
             raise AttributeError('no probability yet')
 
-    def get_move(self):
-        if self.game.history:
-            if len(self.game.history) is 1:
-                self.mct.update_one(self.game.history[0])
-            else:
-                self.mct.update(self.game.history[-2], self.game.history[-1])
+    def update_tree(self):
+        for index in self.game.history[self.tree_move_num:]:
+            self.mct.update_one(index)
+        self.tree_move_num = len(self.game.history)
 
+    def get_move(self):
+        self.update_tree()
         self.mct.play()
+        return self.choose_move()
+
+    async def get_move_async(self):
+        '''与`get_move`相同, 但搜索时让出事件循环, 共用`AsyncEvaluator`的各盘棋的评估合并成批'''
+        self.update_tree()
+        await self.mct.play_async()
+        return self.choose_move()
+
+    def choose_move(self):
         self.probability = self.mct.get_move_probability()
         self.add_history()
         return self.mct.get_move(self.probability)
@@ -102,10 +122,14 @@ class MCTSPlayer(Player):
     def undo(self, index):
         super(MCTSPlayer, self).undo(index)
         self.probability = self.prob_history.pop()
-        if self.mct.root.parent and self.mct.root.parent.parent:
-            self.mct.root = self.mct.root.parent.parent
-        else:
-            self.mct.root = MCTNode(None, 1.0)
+        self.mct.back(2)
+        self.tree_move_num = max(self.tree_move_num - 2, 0)
+
+    def ponder(self):
+        '''己方落子后, 在对方思考时从新的根节点继续搜索, 直到下次调用`get_move`'''
+        if self.game.run:
+            self.update_tree()
+            self.mct.ponder()
 
     def win(self):
         super(MCTSPlayer, self).win()
@@ -115,11 +139,11 @@ class MCTSPlayer(Player):
         self.save_history_to_tfrecord(-1)
 
     def get_model_num(self):
-        return self.mct.net.get_model_num()
+        return self.mct.get_model_num()
 
     def save_history_to_tfrecord(self, reward):
         if utils.SAVE_RECORD:
-            net_model_num = self.mct.net.get_model_num()
+            net_model_num = self.mct.get_model_num()
             verification_pattern = os.path.join(
                 utils.PAI_DB_PATH if utils.USE_PAI else utils.DB_PATH,
                 'game-verification-{}*'.format(net_model_num)
@@ -151,6 +175,7 @@ class MCTSPlayer(Player):
     def reset(self):
         self.prob_history = list()
         self.probability = None
+        self.tree_move_num = 0
         self.mct.reset()
 
 
@@ -0,0 +1,172 @@
+# -*- coding:utf-8 -*-
+'''连珠规则: 黑棋禁手(三三, 四四, 长连)判断'''
+from __future__ import division
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import sys
+
+import numpy as np
+import utils
+from utils.lru import LRUCache, measure_entry_bytes
+from board import get_segment_table
+from pattern import CELL_STATE
+
+REACH = utils.WIN_NUM       # 判断恰好五连需要看到连五两端外侧的一格
+RENJU_TABLES = {}
+
+
+def center_run(own, center):
+    '''经过`center`的连续己方棋子数'''
+    left = np.cumprod(own[:, center::-1], axis=1).sum(axis=1)
+    right = np.cumprod(own[:, center + 1:], axis=1).sum(axis=1)
+    return left + right
+
+
+def get_renju_table(reach=REACH):
+    '''获取黑棋在长为`2 * reach + 1`的线段中心落子后的棋形表, 只在第一次调用时生成
+
+    返回`(weight, five, overline, four_num, three_mask)`, 线段各格状态与`weight`的点积为序号.
+    `five`为恰好五连, `overline`为长连, `four_num`为该线上四的个数(活四算一个),
+    `three_mask`的第`i`位表示在线段第`i`格落子可成活四, 即该线上有活三.
+    '''
+    if reach not in RENJU_TABLES:
+        win_num = utils.WIN_NUM
+        length = 2 * reach + 1
+        center = reach
+        power = 3 ** np.arange(length - 1)
+        weight = np.insert(power, center, 0)
+        state = np.insert(np.arange(power[-1] * 3)[:, np.newaxis] // power % 3, center, 1, axis=1)
+        own, empty = state == 1, state == 0
+        rows = np.arange(len(state))
+
+        run = center_run(own, center)
+        win_cell = np.zeros_like(own)
+        for cell in range(length):
+            placed = own.copy()
+            placed[:, cell] = True
+            win_cell[:, cell] = empty[:, cell] & (center_run(placed, center) == win_num)
+        win_cell_num = win_cell.sum(axis=1)
+        first = win_cell.argmax(axis=1)
+        last = length - 1 - win_cell[:, ::-1].argmax(axis=1)
+        # 相距`WIN_NUM`的两个成五点之间是连续四子, 即一个活四
+        straight = (win_cell_num == 2) & (last - first == win_num)
+        four_num = np.where(straight, 1, np.minimum(win_cell_num, 2))
+
+        # 在空位落子后, 经过中心连成四子, 两端皆空且各自补上后恰好五连, 即成活四
+        three_mask = np.zeros(len(state), np.int64)
+        padded_own = np.pad(own, ((0, 0), (1, 1)), 'constant')
+        padded_empty = np.pad(empty, ((0, 0), (1, 1)), 'constant')
+        for cell in range(length):
+            placed = own.copy()
+            placed[:, cell] = True
+            left = np.cumprod(placed[:, center - 1::-1], axis=1).sum(axis=1)
+            right = np.cumprod(placed[:, center + 1:], axis=1).sum(axis=1)
+            # 在两侧各补一格后的坐标系中, 两端为`center - left`, `center + right + 2`
+            left_end, right_end = center - left, center + right + 2
+            straight_four = (
+                empty[:, cell] & (left + right + 1 == win_num - 1)
+                & padded_empty[rows, left_end] & padded_empty[rows, right_end]
+                & ~padded_own[rows, np.maximum(left_end - 1, 0)]
+                & ~padded_own[rows, np.minimum(right_end + 1, length + 1)]
+                )
+            three_mask[straight_four] |= 1 << cell
+        three_mask[four_num > 0] = 0
+
+        tables = (weight, run == win_num, run > win_num, four_num, three_mask)
+        for table in tables:
+            table.setflags(write=False)
+        RENJU_TABLES[reach] = tables
+    return RENJU_TABLES[reach]
+
+
+class ForbiddenDetector(object):
+    '''黑棋禁手判断, 结果按局面缓存
+
+    三三需要递归判断成活四的点本身是否为禁手, 代价较高, 所以每格与整盘的结果都以
+    棋子的Zobrist键缓存, 超过`cache_size`后淘汰最久未用的.
+    '''
+    def __init__(self, size=utils.SIZE, cache_size=utils.FORBIDDEN_CACHE_SIZE):
+        self.full_size = size ** 2
+        self.segment_table = get_segment_table(size, REACH)
+        self.weight, self.five, self.overline, self.four_num, self.three_mask = get_renju_table()
+        self.cell_state = CELL_STATE[utils.BLACK]
+        self.cache = LRUCache(cache_size)
+        # 按整盘结果一项估计: 键`(棋子键, None)`与只读的掩码
+        self.entry_bytes = (
+            sys.getsizeof((0, None)) + sys.getsizeof(2 ** 63) + sys.getsizeof(np.zeros(self.full_size, np.bool_))
+            + measure_entry_bytes()
+            )
+
+    def limit_memory(self, max_bytes):
+        '''缓存至多占用约`max_bytes`字节, None为只限项数'''
+        self.cache.limit_memory(max_bytes, self.entry_bytes)
+
+    def stone_key(self, board):
+        '''只与棋子有关, 不含行棋方的局面键'''
+        if board.now_color == utils.WHITE:
+            return board.zobrist_key ^ board.zobrist_side
+        return board.zobrist_key
+
+    def get_code(self, board, indices):
+        padded = np.append(board.board, np.int8(utils.WALL))
+        return self.cell_state[padded[self.segment_table[indices]] + 1].dot(self.weight)
+
+    def check(self, board, index, key, code=None):
+        '''黑棋在空位`index`落子是否为禁手, `key`为`board`当前棋子的键'''
+        forbidden = self.cache.get((key, index))
+        if forbidden is None:
+            if code is None:
+                code = self.get_code(board, index)
+            if self.five[code].any():
+                forbidden = False
+            elif self.overline[code].any() or self.four_num[code].sum() >= 2:
+                forbidden = True
+            else:
+                forbidden = self.count_three(board, index, key, code) >= 2
+            self.cache.put((key, index), forbidden)
+        return forbidden
+
+    def count_three(self, board, index, key, code):
+        '''黑棋在`index`落子后形成的真活三个数, 即成活四的点不是禁手的方向数'''
+        three_mask = self.three_mask[code]
+        if np.count_nonzero(three_mask) < 2:
+            return np.count_nonzero(three_mask)
+
+        three_num = 0
+        board.board[index] = utils.BLACK
+        key ^= board.zobrist_piece[utils.BLACK][index]
+        try:
+            for direction, mask in enumerate(three_mask):
+                cells = self.segment_table[index, direction]
+                for cell in range(len(cells)):
+                    if mask >> cell & 1 and not self.check(board, cells[cell], key):
+                        three_num += 1
+                        break
+        finally:
+            board.board[index] = utils.EMPTY
+        return three_num
+
+    def is_forbidden(self, board, index):
+        '''黑棋在`index`落子是否为禁手'''
+        if board.board[index] != utils.EMPTY:
+            return False
+        return self.check(board, index, self.stone_key(board))
+
+    def get_mask(self, board):
+        '''黑棋的全部禁手点, 先对所有空位一次性查表, 只对可能三三的点递归判断'''
+        key = self.stone_key(board)
+        mask = self.cache.get((key, None))
+        if mask is None:
+            mask = np.zeros(self.full_size, np.bool_)
+            empty = board.empty_pos.copy()
+            code = self.get_code(board, empty)
+            five = self.five[code].any(axis=1)
+            sure = ~five & (self.overline[code].any(axis=1) | (self.four_num[code].sum(axis=1) >= 2))
+            mask[empty[sure]] = True
+            maybe = ~five & ~sure & (np.count_nonzero(self.three_mask[code], axis=1) >= 2)
+            for index, cell_code in zip(empty[maybe], code[maybe]):
+                mask[index] = self.check(board, index, key, cell_code)
+            mask.setflags(write=False)
+            self.cache.put((key, None), mask)
+        return mask
@@ -0,0 +1,118 @@
+# -*- coding:utf-8 -*-
+'''威胁空间搜索: 连续冲四(VCF)取胜的判断'''
+from __future__ import division
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import sys
+
+import numpy as np
+import utils
+from utils.lru import LRUCache, measure_entry_bytes
+from pattern import PatternTable, FIVE, FOUR, OPEN_FOUR
+
+# 行棋方的结果
+LOSS, UNKNOWN, WIN = -1, 0, 1
+
+
+class ThreatSolver(object):
+    '''在`Board`上搜索行棋方的连续冲四胜, 至多冲四`depth`次, 至多搜索`node_limit`个节点
+
+    `solve`返回行棋方的结果: 能直接成五或连续冲四取胜为`WIN`, 对方有两个以上成五点而行棋方
+    不能成五为`LOSS`, 其余为`UNKNOWN`. 搜索在棋盘上落子并撤销, 结束后棋盘不变.
+    结果以局面的Zobrist键缓存, 超过`cache_size`后淘汰最久未用的.
+    连珠规则下, 黑棋的禁手点不能用来成五或冲四, 白棋冲四的防点若是黑棋禁手则白棋胜.
+    '''
+    def __init__(self, depth=utils.SOLVER_DEPTH, node_limit=utils.SOLVER_NODE_LIMIT,
+                 cache_size=utils.SOLVER_CACHE_SIZE, forbidden=None):
+        self.depth = depth
+        self.node_limit = node_limit
+        self.cache = LRUCache(cache_size)
+        self.entry_bytes = sys.getsizeof(2 ** 63) + measure_entry_bytes()      # 结果是共享的小整数
+        self.forbidden = forbidden      # `ForbiddenDetector`, 连珠规则下使用
+        self.node_num = 0
+        self.failed = {}
+
+    def limit_memory(self, max_bytes):
+        '''缓存至多占用约`max_bytes`字节, None为只限项数'''
+        self.cache.limit_memory(max_bytes, self.entry_bytes)
+
+    def allowed(self, board, cells, color):
+        '''去掉`color`不能落子的禁手点'''
+        if self.forbidden is None or color != utils.BLACK or not board.renju:
+            return cells
+        return np.array([cell for cell in cells if not self.forbidden.is_forbidden(board, cell)], np.intp)
+
+    def five_cells(self, table, color):
+        '''`color`落子即成五的点'''
+        return self.allowed(table.board, table.find(color, FIVE), color)
+
+    def four_cells(self, table, color):
+        '''`color`落子可成冲四或活四的点'''
+        cells = np.union1d(table.find(color, FOUR), table.find(color, OPEN_FOUR))
+        return self.allowed(table.board, cells, color)
+
+    def play(self, board, table, index):
+        board.move(index)
+        board.round_change(1)
+        table.update(index)
+
+    def undo(self, board, table, index):
+        board.undo()
+        table.update(index)
+
+    def solve(self, board):
+        '''行棋方的结果, 见`WIN`, `LOSS`, `UNKNOWN`'''
+        key = board.zobrist_key
+        result = self.cache.get(key)
+        if result is None:
+            table = PatternTable(board)
+            attacker = board.now_color
+            if self.five_cells(table, attacker).size:
+                result = WIN
+            elif self.five_cells(table, -attacker).size > 1:
+                result = LOSS
+            else:
+                self.node_num = 0
+                self.failed = {}
+                result = WIN if self.search(board, table, attacker, self.depth) else UNKNOWN
+            self.cache.put(key, result)
+        return result
+
+    def search(self, board, table, attacker, depth):
+        '''`attacker`行棋, 能否在`depth`次冲四内取胜'''
+        if self.five_cells(table, attacker).size:
+            return True
+        key = board.zobrist_key
+        if depth == 0 or self.failed.get(key, -1) >= depth:
+            return False
+        self.node_num += 1
+        if self.node_num > self.node_limit:
+            return False
+
+        threats = self.five_cells(table, -attacker)
+        if threats.size > 1:
+            return False
+        candidates = self.four_cells(table, attacker)
+        if threats.size:
+            candidates = np.intersect1d(candidates, threats)
+
+        for move in candidates:
+            self.play(board, table, move)
+            blocks = self.five_cells(table, attacker)
+            if blocks.size > 1:
+                win = True
+            elif blocks.size == 0:
+                win = False
+            elif self.allowed(board, blocks, -attacker).size == 0:
+                win = True
+            else:
+                self.play(board, table, blocks[0])
+                win = self.search(board, table, attacker, depth - 1)
+                self.undo(board, table, blocks[0])
+            self.undo(board, table, move)
+            if win:
+                return True
+
+        self.failed[key] = depth
+        return False
@@ -1,7 +1,6 @@
 # -*- coding:utf-8 -*-
 import sys
 import os
-import gc
 import tensorflow as tf
 from collections import namedtuple
 
@@ -38,6 +37,7 @@ OSS_RECORD_PATH = OSS_ROOT_PATH + 'record/'
 BLACK = 1
 WHITE = -1
 EMPTY = 0
+WALL = 2
 COLOR = {
     BLACK: 'Black',
     WHITE: 'White'
@@ -50,6 +50,9 @@ HUMAN, GOMOCUP, MCTS, RANDOM, TRANS = 0, 1, 2, 3, 4
 SIZE = 20
 FULL_SIZE = SIZE ** 2
 WIN_NUM = 5
+RENJU = False
+FORBIDDEN_CACHE_SIZE = 100000
+ZOBRIST_SEED = 20171019
 SAVE_PSQ = False
 SAVE_RECORD = True
 SAVE_MODEL = False
@@ -61,6 +64,43 @@ PORT = 10329
 # MCTS
 C_PUCT = 3
 MAX_MCTS_EVALUATE_TIME = 1
+MCTS_BATCH_SIZE = 1
+MCTS_VIRTUAL_LOSS = 3
+MCTS_THREAD_NUM = 1
+MCTS_PROCESS_NUM = 1
+MCTS_PROCESS_START = 'fork'
+MCTS_TIME_LIMIT = None
+MCTS_EARLY_STOP = True
+MCTS_CLOSE_RATE = 0.8
+MCTS_TIME_EXTEND = 0.5
+MCTS_CHECK_INTERVAL = 16
+GOMOCUP_TIME_RATE = 0.9
+GOMOCUP_MEMORY_RATE = 0.5
+EVALUATOR_TIMEOUT = 0.001
+ASYNC_BATCH_SIZE = 32
+MCTS_SEARCH_UNDO = True
+MCTS_TREE_TYPE = 'node'
+MCTS_TREE_CAPACITY = 2 ** 16
+MCTS_MAX_NODES = None
+MCTS_MAX_MEMORY = None
+MCTS_CACHE_MEMORY_RATE = 0.25
+MCTS_PRUNE_RATE = 0.8
+MCTS_PONDER = False
+MCTS_PONDER_LIMIT = None
+MCTS_STATS_LOG = True
+MCTS_TRANSPOSITION = False
+MCTS_TRANSPOSITION_SIZE = 2 ** 16
+MCTS_EVAL_CACHE = True
+EVAL_CACHE_SIZE = 2 ** 15
+MCTS_SOLVER = True
+SOLVER_DEPTH = 8
+SOLVER_NODE_LIMIT = 1000
+SOLVER_CACHE_SIZE = 2 ** 16
+MCTS_LAZY_EXPAND = False
+MCTS_WIDEN_BASE = None
+MCTS_WIDEN_RATE = 0.5
+MCTS_NEAR_ONLY = False
+NEAR_RADIUS = 2
 TAU_CHANGE_ROUND = 30
 TAU_UP = 1.0
 TAU_LOW = 0.05
@@ -99,8 +139,6 @@ COMPARE_WIN_RATE = 0.55
 
 
 # function
-CLEAR = gc.collect
-
 def path_init(paths, pai_path=False):
     for path in paths:
         if pai_path:
@@ -0,0 +1,57 @@
+# -*- coding:utf-8 -*-
+'''最近最少使用(LRU)淘汰的缓存'''
+import sys
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    '''至多保存`capacity`项, 超出时淘汰最久未用的, `get`命中与`put`都算作使用'''
+    def __init__(self, capacity):
+        self.max_capacity = capacity
+        self.capacity = capacity
+        self.items = OrderedDict()
+
+    def get(self, key, default=None):
+        value = self.items.get(key, default)
+        if key in self.items:
+            self.items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        if len(self.items) > self.capacity:
+            self.items.popitem(last=False)
+
+    def limit_memory(self, max_bytes, entry_bytes):
+        '''容量取`max_capacity`与`max_bytes`字节能容纳的项数中较小者, 每项约`entry_bytes`字节,
+        `max_bytes`为None时不限内存. 超出新容量的项按最久未用淘汰'''
+        self.capacity = self.max_capacity
+        if max_bytes is not None:
+            self.capacity = min(self.max_capacity, max_bytes // entry_bytes)
+        while len(self.items) > self.capacity:
+            self.items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        return self.items.pop(key, default)
+
+    def clear(self):
+        self.items.clear()
+
+    def values(self):
+        return self.items.values()
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+
+def measure_entry_bytes(num=1024):
+    '''缓存中每项自身的近似字节数, 不含键与值'''
+    items = OrderedDict((key, None) for key in range(num))
+    return sys.getsizeof(items) // num
+
+
+__all__ = ['LRUCache', 'measure_entry_bytes']
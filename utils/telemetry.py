@@ -0,0 +1,86 @@
+# -*- coding:utf-8 -*-
+'''每步搜索的统计记录, 及收集记录的输出'''
+from __future__ import division
+from __future__ import print_function
+
+import json
+from time import time
+
+
+class SearchStats(object):
+    '''一次搜索的统计, `to_dict`给出可序列化的记录
+
+    `lap(name)`把距上次`lap`的时间计入`name`阶段(选择`select`, 评估`evaluate`, 回传`backup`),
+    只能在单线程中使用.
+    '''
+    COUNTERS = (
+        'playouts', 'evaluations', 'terminals', 'solved', 'transpositions', 'nodes', 'max_depth', 'depth_sum',
+        'select_time', 'evaluate_time', 'backup_time'
+    )
+
+    def __init__(self, move=0, reused_visits=0, ponder_playouts=0):
+        self.move = move
+        self.reused_visits = reused_visits
+        self.ponder_playouts = ponder_playouts
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+        self.tree_size = 0
+        self.start_time = time()
+        self.lap_time = self.start_time
+        self.total_time = 0
+
+    def lap(self, name=None):
+        now = time()
+        if name is not None:
+            setattr(self, name + '_time', getattr(self, name + '_time') + now - self.lap_time)
+        self.lap_time = now
+
+    def add_depth(self, depth):
+        self.max_depth = max(self.max_depth, depth)
+        self.depth_sum += depth
+
+    def merge(self, record):
+        '''加上另一次搜索的记录, 用于合并多个进程的统计'''
+        for name in self.COUNTERS:
+            if name == 'max_depth':
+                self.max_depth = max(self.max_depth, record[name])
+            else:
+                setattr(self, name, getattr(self, name) + record[name])
+        self.tree_size += record['tree_size']
+        self.reused_visits += record['reused_visits']
+        self.ponder_playouts += record['ponder_playouts']
+
+    def finish(self, tree_size):
+        self.tree_size = tree_size
+        self.total_time = time() - self.start_time
+
+    def to_dict(self):
+        record = {name: getattr(self, name) for name in self.COUNTERS}
+        record.update(
+            move=int(self.move),
+            reused_visits=int(self.reused_visits),
+            ponder_playouts=int(self.ponder_playouts),
+            tree_size=int(self.tree_size),
+            total_time=self.total_time,
+            avg_depth=self.depth_sum / self.playouts if self.playouts else 0.0,
+            evals_per_sec=self.evaluations / self.total_time if self.total_time else 0.0
+        )
+        return {name: value if isinstance(value, float) else int(value) for name, value in record.items()}
+
+
+def log_sink(logger):
+    '''把记录以一行JSON写入`logger`'''
+    def sink(record):
+        logger.info(json.dumps(record, sort_keys=True))
+    return sink
+
+
+def file_sink(path):
+    '''把记录以一行JSON追加到文件`path`'''
+    def sink(record):
+        with open(path, 'a') as file:
+            file.write(json.dumps(record, sort_keys=True) + '\n')
+    return sink
+
+
+__all__ = ['SearchStats', 'log_sink', 'file_sink']